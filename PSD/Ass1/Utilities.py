@@ -1,3 +1,6 @@
+from datetime import date
+
+
 #Force user to enter a valid input
 def get_validated_input(prompt, validation_func, error_message):
 
@@ -47,4 +50,20 @@ def get_yes_no_input(prompt):
         elif choice in ['n', 'no']:
             return False
         else:
-            print("Invalid input: Please enter 'y' or 'n'.")
\ No newline at end of file
+            print("Invalid input: Please enter 'y' or 'n'.")
+
+#Get a date in YYYY-MM-DD format, empty input returns the default.
+def get_date_input(prompt, min_date=None, default=None):
+    while True:
+        text = input(prompt).strip()
+        if not text:
+            return default
+        try:
+            value = date.fromisoformat(text)
+        except ValueError:
+            print("Invalid input: Please enter a date as YYYY-MM-DD.")
+            continue
+        if min_date is not None and value < min_date:
+            print(f"Error: Date cannot be earlier than {min_date}.")
+            continue
+        return value
@@ -0,0 +1,124 @@
+#Revenue and utilization analytics over the rentals table
+#Aggregates are folded in from one snapshot of every rental and then kept up to date from the change event log:
+# - a rental inserted after the snapshot is read and folded in,
+# - a rental still pending or approved can still change, so it is re-read and re-folded when it has an event.
+#Returned and rejected rentals are final and are never read again. Event ids are given out as rows are written,
+#not when rental ids are allocated, so a rental committed late is still seen even if a higher R-number was not.
+
+
+import threading
+from datetime import date, datetime
+import database
+from events import EventSubscriber
+
+
+REALIZED_STATUSES = ('approved', 'returned')         #Rentals that earn revenue and occupy a car
+OPEN_STATUSES = ('pending', 'approved')              #Rentals whose status can still change
+
+
+class RentalAnalytics:
+
+    def __init__(self):
+        self._events = None                          #Rental events after the snapshot, set on the first refresh
+        self._open = {}                              #rental_id -> fact row as last folded
+        self._groups = {'car': {}, 'make': {}, 'fuel_type': {}}   #key -> [revenue, rentals, rent days]
+        self._realized = 0
+        self._rent_days = 0
+        self._first_start = None
+        self._latency_seconds = 0.0
+        self._latency_count = 0
+        self._report = None
+        self._lock = threading.Lock()
+
+    #Brings the aggregates up to date, returns True if anything changed
+    def refresh(self):
+        with self._lock:
+            changed = False
+            if self._events is None:
+                rows, last_event_id = database.get_rental_facts_snapshot_in_db()
+                for row in rows:
+                    self._fold(row, 1)
+                    self._track(row)
+                self._events = EventSubscriber(entities=['rental'])
+                self._events.commit(last_event_id)
+                changed = bool(rows)
+            while True:
+                events = self._events.read()
+                if not events:
+                    break
+                inserted = {event.entity_id for event in events if event.action == 'insert'}
+                touched = list(dict.fromkeys(event.entity_id for event in events))
+                rows = {row[1]: row for row in database.get_rental_facts_by_ids_in_db(touched)}
+                for rental_id in touched:
+                    row, old = rows.get(rental_id), self._open.get(rental_id)
+                    if old is not None:
+                        if row is None or old[5] != row[5] or old[10] != row[10]:
+                            self._fold(old, -1)
+                            if row is not None:
+                                self._fold(row, 1)
+                            changed = True
+                    elif row is not None and rental_id in inserted:
+                        self._fold(row, 1)
+                        changed = True
+                    else:
+                        continue                     #Closed before the snapshot, or inserted and deleted since
+                    if row is None:
+                        self._open.pop(rental_id, None)
+                    else:
+                        self._track(row)
+                self._events.commit(events[-1].event_id)
+            if changed:
+                self._report = None
+            return changed
+
+    def report(self):                                #Cached until a refresh sees new or changed rentals
+        self.refresh()
+        with self._lock:
+            if self._report is None:
+                self._report = self._build_report(database.count_cars_in_db())
+            return self._report
+
+    def _track(self, row):
+        if row[5] in OPEN_STATUSES:
+            self._open[row[1]] = row
+        else:
+            self._open.pop(row[1], None)
+
+    def _fold(self, row, sign):
+        number, rental_id, car_id, make, fuel_type, status, start_date, end_date, total_cost, submitted_at, decided_at = row
+        if self._first_start is None or start_date < self._first_start:
+            self._first_start = start_date
+        if status in REALIZED_STATUSES:
+            rent_days = (date.fromisoformat(end_date) - date.fromisoformat(start_date)).days
+            for dimension, key in (('car', car_id), ('make', make or 'Unknown'), ('fuel_type', fuel_type or 'Unknown')):
+                group = self._groups[dimension].setdefault(key, [0.0, 0, 0])
+                group[0] += sign * total_cost
+                group[1] += sign
+                group[2] += sign * rent_days
+            self._realized += sign
+            self._rent_days += sign * rent_days
+        if submitted_at and decided_at:
+            waited = datetime.fromisoformat(decided_at) - datetime.fromisoformat(submitted_at)
+            self._latency_seconds += sign * waited.total_seconds()
+            self._latency_count += sign
+
+    def _build_report(self, fleet_size):
+        #Utilization: rented car-days over the car-days available since the first rental started
+        period_days = (date.today() - date.fromisoformat(self._first_start)).days + 1 if self._first_start else 0
+        capacity = fleet_size * period_days
+
+        def table(dimension):
+            return {key: {'revenue': round(revenue, 2), 'rentals': rentals, 'rent_days': days}
+                    for key, (revenue, rentals, days) in sorted(self._groups[dimension].items()) if rentals}
+
+        return {
+            'revenue_total': round(sum(g[0] for g in self._groups['car'].values()), 2),
+            'revenue_by_car': table('car'),
+            'revenue_by_make': table('make'),
+            'revenue_by_fuel_type': table('fuel_type'),
+            'utilization_rate': self._rent_days / capacity if capacity else 0.0,
+            'average_rent_days': self._rent_days / self._realized if self._realized else 0.0,
+            'average_approval_hours': (self._latency_seconds / self._latency_count / 3600
+                                       if self._latency_count else None),
+            'rentals_counted': self._realized,
+        }
@@ -0,0 +1,96 @@
+#Asyncio facade over CarRentalSystem, for serving the rental logic behind an async web API.
+#Blocking database work runs on a bounded thread pool; every worker thread keeps its own pooled
+#connection from database.py, and a semaphore caps how many calls can wait for a worker at once,
+#so a burst of sessions queues in the event loop instead of piling up threads.
+#With read_workers the fleet listings are answered by that many worker processes (database.ReadWorkerPool),
+#so building the Car objects is the only part of a listing left on this process.
+
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import database
+from system import CarRentalSystem
+
+
+DEFAULT_WORKERS = 8
+
+
+class AsyncCarRentalSystem:
+
+    def __init__(self, system=None, max_workers=DEFAULT_WORKERS, max_pending=None, read_workers=0):
+        self._system = system or CarRentalSystem()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='car-rental-db')
+        self._slots = asyncio.Semaphore(max_pending or max_workers * 4)
+        self._read_pool = None
+        if read_workers:
+            self._read_pool = database.ReadWorkerPool(read_workers)
+            self._system.use_read_pool(self._read_pool)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):                           #Waits for running calls, then stops the workers
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        if self._read_pool is not None:
+            self._system.use_read_pool(None)
+            await asyncio.get_running_loop().run_in_executor(None, self._read_pool.close)
+            self._read_pool = None
+
+    async def _run(self, method, *args, **kwargs):
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+    #Users
+    async def register_customer(self, username, password):
+        return await self._run(self._system.register_customer, username, password)
+
+    async def authenticate_user(self, username, password):
+        return await self._run(self._system.authenticate_user, username, password)
+
+    #Listings
+    async def get_all_cars(self):
+        return await self._run(self._system.get_all_cars)
+
+    async def get_available_cars(self):
+        return await self._run(self._system.get_available_cars)
+
+    async def search_available_cars(self, **filters):
+        return await self._run(self._system.search_available_cars, **filters)
+
+    async def get_cars_free_between(self, start_date, end_date):
+        return await self._run(self._system.get_cars_free_between, start_date, end_date)
+
+    async def find_car_by_id(self, car_id):
+        return await self._run(self._system.find_car_by_id, car_id)
+
+    #Bookings
+    async def quote_rental(self, car_id, rent_days, start_date=None, additional_fees=0.0):
+        return await self._run(self._system.quote_rental, car_id, rent_days, start_date, additional_fees)
+
+    async def book_car(self, customer_username, car_id, rent_days, additional_fees, start_date=None):
+        return await self._run(self._system.book_car, customer_username, car_id, rent_days,
+                               additional_fees, start_date)
+
+    async def return_car(self, rental_id):
+        return await self._run(self._system.return_car, rental_id)
+
+    async def get_customer_rentals(self, username):
+        return await self._run(self._system.get_customer_rentals, username)
+
+    #Admin
+    async def get_rentals_by_status(self, status):
+        return await self._run(self._system.get_rentals_by_status, status)
+
+    async def pending_request_count(self):
+        return await self._run(self._system.pending_request_count)
+
+    async def wait_for_pending_request(self, timeout=None):  #Holds one worker while it waits
+        return await self._run(self._system.wait_for_pending_request, timeout)
+
+    async def manage_rental_request(self, rental_id, action):
+        return await self._run(self._system.manage_rental_request, rental_id, action)
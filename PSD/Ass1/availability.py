@@ -0,0 +1,66 @@
+#Booking calendar
+#For every car the bookings are kept as a sorted list of non-overlapping [start, end) date intervals,
+#so checking whether a car is free over a date range is a binary search: O(log bookings) per car.
+#The database stays the arbiter between processes, this calendar is the fast in-process answer.
+
+
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+
+
+def as_date(value):                                  #Rentals loaded from SQLite carry ISO strings
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+class AvailabilityCalendar:
+
+    def __init__(self):
+        self._bookings = {}                          #car_id -> sorted list of (start, end, rental_id)
+        self._by_rental = {}                         #rental_id -> (car_id, start, end)
+        self._lock = threading.Lock()
+
+    def __contains__(self, rental_id):
+        return rental_id in self._by_rental
+
+    def is_free(self, car_id, start, end):
+        start, end = as_date(start), as_date(end)
+        with self._lock:
+            return self._is_free(car_id, start, end)
+
+    def _is_free(self, car_id, start, end):
+        bookings = self._bookings.get(car_id)
+        if not bookings:
+            return True
+        #Intervals don't overlap, so ends are sorted too; only the last booking starting before
+        #`end` can reach into the requested range.
+        i = bisect_left(bookings, (end,))
+        return i == 0 or bookings[i - 1][1] <= start
+
+    def free_cars(self, car_ids, start, end):
+        start, end = as_date(start), as_date(end)
+        return [car_id for car_id in car_ids if self.is_free(car_id, start, end)]
+
+    def book(self, car_id, start, end, rental_id):   #False if the range clashes with another booking
+        start, end = as_date(start), as_date(end)
+        with self._lock:
+            if rental_id in self._by_rental or not self._is_free(car_id, start, end):
+                return False
+            insort(self._bookings.setdefault(car_id, []), (start, end, rental_id))
+            self._by_rental[rental_id] = (car_id, start, end)
+            return True
+
+    def release(self, rental_id):
+        with self._lock:
+            entry = self._by_rental.pop(rental_id, None)
+            if entry is None:
+                return
+            car_id, start, end = entry
+            bookings = self._bookings[car_id]
+            bookings.pop(bisect_left(bookings, (start, end, rental_id)))
+            if not bookings:
+                del self._bookings[car_id]
+
+    def bookings_for(self, car_id):
+        with self._lock:
+            return list(self._bookings.get(car_id, []))
@@ -0,0 +1,164 @@
+#Non-interactive batch mode
+#Reads one JSON operation per line and runs it against CarRentalSystem, writing one JSON result per line.
+#Operations are grouped, every group is one database transaction and every operation inside it a savepoint,
+#so a failing operation only undoes its own writes and the rest of the group still commits together.
+#Slow preparation, i.e. password hashing, runs before the group takes the write lock.
+#
+#  {"op": "register", "username": "amy", "password": "secret"}
+#  {"op": "book", "username": "amy", "car_id": "Car-001", "rent_days": 3, "additional_fees": 0, "start_date": "2026-01-05"}
+#  {"op": "approve", "rental_id": "R-001"}            also "reject", either may give "rental_ids": [...]
+#  {"op": "return", "rental_id": "R-001"}
+#  {"op": "archive", "older_than_days": 365}
+#
+#An optional "id" on an operation is copied to its result.
+
+
+import json
+
+import database
+from system import ARCHIVE_AFTER_DAYS
+
+
+BATCH_GROUP_SIZE = 200                               #Operations per transaction
+
+
+def _prepare_register(system, op):
+    if not isinstance(op['password'], str):
+        raise ValueError("password must be a string")
+    return system.hash_password(op['password'])
+
+
+def _register(system, op, password_hash):
+    success, message = system.register_customer_with_hash(op['username'], password_hash)
+    return {'ok': success, 'message': message}
+
+
+def _book(system, op, prepared):
+    rental, message = system.book_car(op['username'], op['car_id'], int(op['rent_days']),
+                                      float(op.get('additional_fees', 0)), op.get('start_date'))
+    if not rental:
+        return {'ok': False, 'message': message}
+    return {'ok': True, 'message': message, 'rental_id': rental.get_rental_id(),
+            'total_cost': rental.get_total_cost()}
+
+
+def _decide(system, op, prepared):
+    rental_ids = op['rental_ids'] if 'rental_ids' in op else [op['rental_id']]
+    if isinstance(rental_ids, str):
+        rental_ids = [rental_ids]
+    results = system.manage_rental_requests(rental_ids, op['op'])
+    return {'ok': all(success for success, _ in results.values()),
+            'message': '; '.join(message for _, message in results.values()),
+            'results': {rental_id: success for rental_id, (success, _) in results.items()}}
+
+
+def _return(system, op, prepared):
+    success, message, total_cost = system.return_car(op['rental_id'])
+    result = {'ok': success, 'message': message}
+    if success:
+        result['total_cost'] = total_cost
+    return result
+
+
+def _archive(system, op, prepared):
+    moved = system.archive_closed_rentals(int(op.get('older_than_days', ARCHIVE_AFTER_DAYS)))
+    return {'ok': True, 'message': f"{moved} rental records archived.", 'archived': moved}
+
+
+OPERATIONS = {'register': _register, 'book': _book, 'approve': _decide, 'reject': _decide, 'return': _return,
+              'archive': _archive}
+PREPARE = {'register': _prepare_register}            #Run outside the transaction, result passed to the operation
+
+
+def _parse(line_no, line):                          #(operation, None) or (None, error result)
+    try:
+        op = json.loads(line)
+    except ValueError as e:
+        return None, {'line': line_no, 'ok': False, 'message': f"Invalid JSON: {e}"}
+    if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+        kind = op.get('op') if isinstance(op, dict) else None
+        return None, {'line': line_no, 'ok': False, 'message': f"Unknown operation: {kind!r}"}
+    return op, None
+
+
+def _new_result(line_no, op):
+    result = {'line': line_no, 'op': op['op']}
+    if 'id' in op:
+        result['id'] = op['id']
+    return result
+
+
+def _error_message(e):
+    if isinstance(e, KeyError):
+        return f"Missing field: {e.args[0]}"
+    if isinstance(e, (ValueError, TypeError)):
+        return f"Invalid value: {e}"
+    return f"{type(e).__name__}: {e}"
+
+
+def _prepare(system, line_no, op):                  #(prepared value, None) or (None, error result)
+    try:
+        prepare = PREPARE.get(op['op'])
+        return (prepare(system, op) if prepare else None), None
+    except Exception as e:
+        return None, dict(_new_result(line_no, op), ok=False, message=_error_message(e))
+
+
+def _run_one(system, line_no, op, prepared):
+    result = _new_result(line_no, op)
+    try:
+        with database.transaction():                 #Savepoint, an error only rolls back this operation
+            result.update(OPERATIONS[op['op']](system, op, prepared))
+    except Exception as e:
+        result.update(ok=False, message=_error_message(e))
+    return result
+
+
+def _run_group(system, group):
+    prepared = []
+    for line_no, op, error in group:
+        value = None
+        if op is not None:
+            value, error = _prepare(system, line_no, op)
+            if error is not None:
+                op = None
+        prepared.append((line_no, op, error, value))
+    results = []
+    try:
+        with database.transaction():
+            #The system caches are updated as each operation finishes, drop them if the group never commits
+            database.on_rollback(system.discard_caches)
+            for line_no, op, error, value in prepared:
+                results.append(error if op is None else _run_one(system, line_no, op, value))
+    except Exception as e:
+        return [dict(error if op is None else _new_result(line_no, op), ok=False,
+                     message=error['message'] if op is None else f"Batch group rolled back: {e}")
+                for line_no, op, error, _ in prepared]
+    return results
+
+
+#Runs the operations read from lines and writes a JSON result line to out for each one.
+#Returns (operations, failures).
+def run_batch(system, lines, out, group_size=BATCH_GROUP_SIZE):
+    total = failures = 0
+    group = []
+
+    def flush():
+        nonlocal failures
+        for result in _run_group(system, group):
+            failures += not result['ok']
+            out.write(json.dumps(result) + '\n')
+        group.clear()
+
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        total += 1
+        op, error = _parse(line_no, line)
+        group.append((line_no, op, error))
+        if len(group) >= group_size:
+            flush()
+    if group:
+        flush()
+    out.flush()
+    return total, failures
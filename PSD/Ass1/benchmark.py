@@ -0,0 +1,181 @@
+#Benchmark harness for the car rental service
+#Builds a synthetic fleet, customer base and rental history in a temporary car_rental.db, times the
+#main CarRentalSystem operations against it and prints (or saves) the results as JSON, so runs on
+#different commits can be compared.
+#
+#Usage: python benchmark.py --scale 1k [--ops 50] [--output results.json]
+
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import database
+from security import PasswordHasher
+from system import CarRentalSystem
+
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}   #Number of rentals in the history
+MAKES = [('Toyota', 'Corolla'), ('Mazda', 'CX-5'), ('Honda', 'Fit'), ('Suzuki', 'Swift'), ('Nissan', 'Leaf')]
+FUEL_TYPES = ['Petrol', 'Hybrid', 'Diesel', 'Electric']
+PASSWORD = 'bench-password'
+READ_WORKERS = 4                                     #Processes in the read pool and threads in a search burst
+
+
+#Sizes derived from the rental count: one car per 10 rentals, one customer per 20
+def scale_sizes(rentals):
+    return {'rentals': rentals, 'cars': max(rentals // 10, 100), 'customers': max(rentals // 20, 50)}
+
+
+def generate_data(sizes, seed=42):
+    rng = random.Random(seed)
+    conn = database.get_connection()
+    today = date.today()
+
+    cars = []
+    for i in range(1, sizes['cars'] + 1):
+        make, model = rng.choice(MAKES)
+        cars.append([f"Car-{i:06d}", make, model, rng.randint(2015, 2025), rng.randint(1000, 150000),
+                     1, 1, 14, round(rng.uniform(40, 150), 2), rng.choice(FUEL_TYPES)])
+
+    #One hash shared by every synthetic customer, PBKDF2 per row would dominate generation time
+    password_hash = PasswordHasher().hash(PASSWORD)
+    users = [(f"customer{i}", password_hash, 'customer') for i in range(sizes['customers'])]
+    users.append(('admin', password_hash, 'admin'))
+
+    rentals = []
+    for i in range(1, sizes['rentals'] + 1):
+        car = cars[rng.randrange(len(cars))]
+        days = rng.randint(1, 14)
+        start = today - timedelta(days=rng.randint(30, 3 * 365))
+        status = rng.choices(['returned', 'rejected', 'approved', 'pending'], [85, 10, 3, 2])[0]
+        if status in ('approved', 'pending'):
+            car[5] = 0                               #An active rental holds the car
+        submitted = f"{start - timedelta(days=1)}T09:00:00"
+        decided = f"{start - timedelta(days=1)}T{rng.randint(10, 17)}:00:00" if status != 'pending' else None
+        rentals.append((f"R-{i:03d}", f"customer{rng.randrange(sizes['customers'])}", car[0], str(start),
+                        str(start + timedelta(days=days)), days * car[8], 0.0, status,
+                        str(start + timedelta(days=days)) if status == 'returned' else None, submitted, decided))
+
+    with database.transaction():
+        conn.executemany('INSERT INTO cars VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0)', cars)
+        conn.executemany('INSERT INTO users VALUES (?, ?, ?)', users)
+        conn.executemany('INSERT INTO rentals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rentals)
+        conn.execute("UPDATE sequences SET value = ? WHERE name = 'rental'", (sizes['rentals'],))
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def summarize(samples):                              #Milliseconds per call
+    samples = sorted(samples)
+    return {
+        'calls': len(samples),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def search_burst(system, ops):                       #ops listing pages fetched from READ_WORKERS threads at once
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        list(executor.map(lambda _: system.search_available_cars(), range(ops)))
+
+
+def run_benchmarks(sizes, ops):
+    results = {}
+
+    CarRentalSystem._instance = None
+    elapsed, system = timed(CarRentalSystem)
+    results['startup'] = summarize([elapsed])
+
+    customers = [f"customer{i}" for i in range(min(ops, sizes['customers']))]
+    results['authenticate_user_cold'] = summarize([timed(system.authenticate_user, c, PASSWORD)[0] for c in customers])
+    results['authenticate_user_warm'] = summarize([timed(system.authenticate_user, c, PASSWORD)[0] for c in customers])
+
+    elapsed, cars = timed(system.get_available_cars)
+    results['get_available_cars_cold'] = summarize([elapsed])
+    results['get_available_cars_warm'] = summarize([timed(system.get_available_cars)[0] for _ in range(ops)])
+    results['search_available_cars_page'] = summarize(
+        [timed(system.search_available_cars)[0] for _ in range(ops)])
+    #The same pages answered by read worker processes, one call at a time and as a burst from several threads
+    results['search_available_cars_burst'] = summarize([timed(search_burst, system, ops)[0]])
+    with database.ReadWorkerPool(READ_WORKERS) as pool:
+        system.use_read_pool(pool)
+        pool.call(database.count_cars_in_db)         #Start the workers before timing
+        results['search_available_cars_page_read_pool'] = summarize(
+            [timed(system.search_available_cars)[0] for _ in range(ops)])
+        results['search_available_cars_burst_read_pool'] = summarize([timed(search_burst, system, ops)[0]])
+        system.use_read_pool(None)
+
+    booked = []
+    samples = []
+    for i, car in enumerate(cars[:ops]):
+        elapsed, (rental, message) = timed(system.book_car, customers[i % len(customers)], car.get_car_id(), 3, 0.0)
+        samples.append(elapsed)
+        if rental:
+            booked.append(rental.get_rental_id())
+    results['book_car'] = summarize(samples)
+
+    results['manage_rental_request'] = summarize(
+        [timed(system.manage_rental_request, rental_id, 'approve')[0] for rental_id in booked])
+    results['return_car'] = summarize([timed(system.return_car, rental_id)[0] for rental_id in booked])
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the car rental service on synthetic data.")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='1k', help="size of the rental history")
+    parser.add_argument('--ops', type=int, default=50, help="calls timed per operation")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    sizes = scale_sizes(SCALES[args.scale])
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_connections()
+        database.DB_NAME = os.path.join(tmp, 'car_rental.db')
+        database.create_tables()
+        elapsed, _ = timed(generate_data, sizes, args.seed)
+        report = {
+            'scale': args.scale,
+            'sizes': sizes,
+            'commit': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'generate_ms': round(elapsed, 1),
+            'results': run_benchmarks(sizes, args.ops),
+        }
+        database.close_connections()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
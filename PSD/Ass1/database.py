@@ -1,6 +1,13 @@
 import sqlite3
 import csv
 import os
+import pathlib
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+import query_stats
 
 
 #Database system
@@ -8,17 +15,173 @@ import os
 
 
 DB_NAME = 'car_rental.db'
+STATEMENT_CACHE_SIZE = 256                           #Prepared statements kept per connection
+READ_ONLY_CONNECTIONS = True                         #Serve the read helpers from read-only connections
 
+_local = threading.local()                           #One long-lived connection per thread
+_open_connections = []
+_read_connections = set()                            #The read-only ones among _open_connections
+_connections_lock = threading.Lock()
+_generation = 0                                      #Bumped by close_connections() so threads reconnect
 
-def connect_db():                                    #Connect to SQLite database
-    conn = sqlite3.connect(DB_NAME)
+
+def connect_db():                                    #Open a new SQLite connection in WAL mode
+    #check_same_thread is off only so close_connections() can close other threads' connections
+    conn = sqlite3.connect(DB_NAME, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')        #WAL only needs to fsync at checkpoints
+    return conn
+
+
+def get_connection():                                #Reuse this thread's connection, reopen if DB_NAME changed
+    conn = getattr(_local, 'conn', None)
+    key = (DB_NAME, _generation)
+    if conn is None or _local.key != key:
+        if conn is not None and _local.key[1] == _generation:
+            _release(conn)
+        conn = connect_db()
+        _local.conn = conn
+        _local.key = key
+        with _connections_lock:
+            _open_connections.append(conn)
     return conn
 
 
-def create_tables():                                 #Creating all three tables
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('''
+def connect_read_only():                             #Open a read-only connection, WAL lets it read while a write is open
+    uri = pathlib.Path(os.path.abspath(DB_NAME)).as_uri() + '?mode=ro'
+    return sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=False)
+
+
+#Read helpers use this thread's read-only connection; writes stay on the single writer from get_connection().
+#Inside transaction() reads go to the writer too, so they see the block's own uncommitted writes.
+def get_read_connection():
+    if not READ_ONLY_CONNECTIONS or getattr(_local, 'depth', 0):
+        return get_connection()
+    conn = getattr(_local, 'read_conn', None)
+    key = (DB_NAME, _generation)
+    if conn is None or _local.read_key != key:
+        if conn is not None and _local.read_key[1] == _generation:
+            _release(conn)
+        conn = connect_read_only()
+        _local.read_conn = conn
+        _local.read_key = key
+        with _connections_lock:
+            _open_connections.append(conn)
+            _read_connections.add(conn)
+    return conn
+
+
+def _change_events_written(conn):                   #Rows added by the change_events triggers so far
+    try:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_events'").fetchone()
+    except sqlite3.OperationalError:                 #Not migrated yet
+        return 0
+    return row[0] if row else 0
+
+
+instrumented = query_stats.instrumented(get_connection, _change_events_written)  #Per-helper timing, a flag check unless stats are enabled
+instrumented_read = query_stats.instrumented()        #Read helpers are counted by the rows they return, the writer is never touched
+query_stats.register_module(__file__)
+
+
+def _release(conn):
+    with _connections_lock:
+        if conn in _open_connections:
+            _open_connections.remove(conn)
+        _read_connections.discard(conn)
+    conn.close()
+
+
+def close_connections():                             #Close every pooled connection, e.g. on exit or in tests
+    global _generation
+    with _connections_lock:
+        conns = list(_open_connections)
+        read_only = set(_read_connections)
+        _open_connections.clear()
+        _read_connections.clear()
+        _generation += 1
+    #Readers first: the last connection to close folds the WAL back into the database file and removes it,
+    #which a read-only connection cannot do, so a writer has to be last
+    for conn in sorted(conns, key=lambda conn: conn not in read_only):
+        conn.close()
+
+
+def _commit(conn):                                   #Inside transaction() the commit is deferred to the end of the block
+    if not getattr(_local, 'depth', 0):
+        conn.commit()
+
+
+#Unit of work: every helper called inside the block shares one transaction and one commit.
+#Nested blocks become savepoints, so an inner failure only rolls back its own writes.
+@contextmanager
+def transaction():
+    conn = get_connection()
+    depth = getattr(_local, 'depth', 0)
+    if depth == 0:
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('BEGIN IMMEDIATE')              #Take the write lock up front, no upgrade deadlocks
+        _local.rollback_hooks = []
+    else:
+        conn.execute(f'SAVEPOINT uow_{depth}')
+    _local.depth = depth + 1
+    try:
+        yield conn
+    except BaseException:
+        _local.depth = depth
+        if depth == 0:
+            conn.rollback()
+        else:
+            conn.execute(f'ROLLBACK TO uow_{depth}')
+            conn.execute(f'RELEASE uow_{depth}')
+        _run_rollback_hooks(depth + 1)
+        raise
+    _local.depth = depth
+    if depth == 0:
+        conn.commit()
+        _local.rollback_hooks = []
+    else:
+        conn.execute(f'RELEASE uow_{depth}')
+        #The savepoint's writes now belong to the enclosing block, and so do its hooks
+        _local.rollback_hooks = [(min(level, depth), hook) for level, hook in _local.rollback_hooks]
+
+
+def in_transaction():                                #True inside a transaction() block on this thread
+    return bool(getattr(_local, 'depth', 0))
+
+
+def on_rollback(hook):                               #Call hook() if the current transaction block is rolled back
+    depth = getattr(_local, 'depth', 0)
+    if depth:
+        _local.rollback_hooks.append((depth, hook))
+
+
+def _run_rollback_hooks(level):
+    hooks = _local.rollback_hooks
+    _local.rollback_hooks = [(l, h) for l, h in hooks if l < level]
+    for l, hook in reversed(hooks):
+        if l >= level:
+            hook()
+
+
+def create_tables():                                 #Creating all tables, a new database simply runs every migration
+    migrate()
+
+
+RENTAL_NUMBER_SQL = 'CAST(SUBSTR(rental_id, 3) AS INTEGER)'
+
+
+#Schema migrations
+#Each step runs once, in order, inside its own transaction; PRAGMA user_version records how many
+#have been applied, so existing databases are upgraded in place on start without a reload.
+#Steps stay idempotent because databases from before the runner may already have some changes.
+
+def _column_names(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def _migration_base_tables(conn):                    #The original three tables
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS cars (
             car_id TEXT PRIMARY KEY,
             make TEXT NOT NULL,
@@ -32,16 +195,14 @@ def create_tables():                                 #Creating all three tables
             fuel_type TEXT NOT NULL
         )
     ''')
-    
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
             username TEXT PRIMARY KEY,
             password TEXT NOT NULL,
             role TEXT NOT NULL
         )
     ''')
-    
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS rentals (
             rental_id TEXT PRIMARY KEY,
             customer_username TEXT NOT NULL,
@@ -56,61 +217,345 @@ def create_tables():                                 #Creating all three tables
             FOREIGN KEY (car_id) REFERENCES cars(car_id)
         )
     ''')
-    
-    conn.commit()
-    conn.close()
+
+
+def _migration_car_search_indexes(conn):             #Available-car search, car_id last so keyset paging stays ordered
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cars_available ON cars (available_now, car_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cars_fuel ON cars (fuel_type COLLATE NOCASE, available_now, car_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cars_make ON cars (make COLLATE NOCASE, available_now, car_id)')
+
+
+def _migration_sequences(conn):                      #Named counters for ids shared by every process
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    if conn.execute("SELECT 1 FROM sequences WHERE name = 'rental'").fetchone() is None:
+        conn.execute("INSERT INTO sequences (name, value) VALUES ('rental', ?)", (get_max_rental_number_from_db(),))
+
+
+def _migration_car_version(conn):                    #Row version for optimistic locking
+    if 'version' not in _column_names(conn, 'cars'):
+        conn.execute('ALTER TABLE cars ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+
+
+def _migration_rental_timestamps(conn):              #Request timestamps for approval latency and the pending queue order
+    rental_columns = _column_names(conn, 'rentals')
+    for column in ('submitted_at', 'decided_at'):
+        if column not in rental_columns:
+            conn.execute(f'ALTER TABLE rentals ADD COLUMN {column} TEXT')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rentals_number ON rentals ({RENTAL_NUMBER_SQL})')
+
+
+def _migration_rental_lookup_indexes(conn):          #Customer, status and per-car rental lookups
+    #cars(available_now) is already covered by idx_cars_available
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rentals_customer ON rentals (customer_username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rentals_status ON rentals (status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rentals_car ON rentals (car_id, start_date)')
+
+
+def _migration_rentals_archive(conn):                #Closed rentals moved out of the hot table by archive_closed_rentals_in_db
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS rentals_archive (
+            rental_id TEXT PRIMARY KEY,
+            customer_username TEXT NOT NULL,
+            car_id TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            total_cost REAL NOT NULL,
+            additional_fees REAL NOT NULL,
+            status TEXT NOT NULL,
+            return_date TEXT,
+            submitted_at TEXT,
+            decided_at TEXT,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rentals_archive_customer ON rentals_archive (customer_username)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rentals_archive_status ON rentals_archive (status)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_rentals_archive_number ON rentals_archive ({RENTAL_NUMBER_SQL})')
+
+
+#Change data capture: triggers append every rental and car change to change_events in the writing
+#transaction, so the log can never disagree with the tables. events.py reads it from per-subscriber cursors.
+_RENTAL_EVENT_JSON = '''json_object('customer_username', {0}.customer_username, 'car_id', {0}.car_id,
+    'start_date', {0}.start_date, 'end_date', {0}.end_date, 'total_cost', {0}.total_cost,
+    'status', {0}.status, 'return_date', {0}.return_date)'''
+_CAR_EVENT_JSON = '''json_object('make', {0}.make, 'model', {0}.model, 'available_now', {0}.available_now,
+    'mileage', {0}.mileage, 'daily_rate', {0}.daily_rate, 'version', {0}.version)'''
+_EVENT_TRIGGERS = {
+    'rentals_insert_event': ('AFTER INSERT ON rentals', '',
+                             "'rental', new.rental_id, 'insert'", _RENTAL_EVENT_JSON.format('new')),
+    'rentals_update_event': ('AFTER UPDATE ON rentals',
+                             'WHEN old.status IS NOT new.status OR old.return_date IS NOT new.return_date',
+                             "'rental', new.rental_id, 'update'", _RENTAL_EVENT_JSON.format('new')),
+    'rentals_delete_event': ('AFTER DELETE ON rentals',        #Archival moves are logged by the archive trigger
+                             'WHEN NOT EXISTS (SELECT 1 FROM rentals_archive WHERE rental_id = old.rental_id)',
+                             "'rental', old.rental_id, 'delete'", _RENTAL_EVENT_JSON.format('old')),
+    'rentals_archive_event': ('AFTER INSERT ON rentals_archive', '',
+                              "'rental', new.rental_id, 'archive'", _RENTAL_EVENT_JSON.format('new')),
+    'cars_insert_event': ('AFTER INSERT ON cars', '', "'car', new.car_id, 'insert'", _CAR_EVENT_JSON.format('new')),
+    'cars_update_event': ('AFTER UPDATE ON cars',
+                          'WHEN old.available_now IS NOT new.available_now OR old.mileage IS NOT new.mileage '
+                          'OR old.daily_rate IS NOT new.daily_rate OR old.version IS NOT new.version',
+                          "'car', new.car_id, 'update'", _CAR_EVENT_JSON.format('new')),
+    'cars_delete_event': ('AFTER DELETE ON cars', '', "'car', old.car_id, 'delete'", _CAR_EVENT_JSON.format('old')),
+}
+
+
+def _migration_change_events(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS event_cursors (
+            subscriber TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL
+        )
+    ''')
+    for name, (timing, condition, key, payload) in _EVENT_TRIGGERS.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name} {timing} {condition}
+            BEGIN
+                INSERT INTO change_events (entity, entity_id, action, payload) VALUES ({key}, {payload});
+            END
+        ''')
+
+
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_car_search_indexes,
+    _migration_sequences,
+    _migration_car_version,
+    _migration_rental_timestamps,
+    _migration_rental_lookup_indexes,
+    _migration_rentals_archive,
+    _migration_change_events,
+]
+
+
+@instrumented
+def get_schema_version():
+    return get_connection().execute('PRAGMA user_version').fetchone()[0]
+
+
+@instrumented
+def migrate():                                       #Applies pending migrations, returns how many ran
+    conn = get_connection()
+    current = get_schema_version()
+    for number, step in enumerate(MIGRATIONS[current:], start=current + 1):
+        with transaction():
+            step(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+    return max(len(MIGRATIONS) - current, 0)
+
+
+#Atomically reserves `count` ids from a named sequence and returns the first and last of the range.
+#Inside a transaction() block the reservation is rolled back with the block.
+@instrumented
+def reserve_ids_in_db(name, count=1):
+    conn = get_connection()
+    with transaction():
+        cur = conn.execute('UPDATE sequences SET value = value + ? WHERE name = ? RETURNING value', (count, name))
+        last = cur.fetchone()[0]
+    return last - count + 1, last
+
+
+#Hands out ids from blocks reserved in the sequences table, so processes sharing the database
+#never issue the same id. Larger blocks mean fewer writes, unused ids are lost when a process exits.
+class IdBlockAllocator:
+
+    def __init__(self, name, block_size=1):
+        self._name = name
+        self._block_size = block_size
+        self._next = 1
+        self._last = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            if self._next > self._last:
+                self._next, self._last = reserve_ids_in_db(self._name, self._block_size)
+                on_rollback(self._discard)           #A rolled back reservation may be handed out again
+            value = self._next
+            self._next += 1
+            return value
+
+    def _discard(self):
+        with self._lock:
+            self._next, self._last = 1, 0
+
 
 #Cars operations, importing car data from original csv file with all the colunms listed
-def import_cars_from_csv(csv_filename):
-    conn = connect_db()
-    cur = conn.cursor()
-    with open(csv_filename, 'r', newline='', encoding='utf-8') as file:
-        reader = csv.DictReader(file)
-        to_insert = []
-        for row in reader:
-            to_insert.append((
-                row['car_id'],
-                row['make'],
-                row['model'],
-                int(row['year']),
-                int(row['mileage']),
-                int(row['available_now']),
-                int(row['min_rent_days']),
-                int(row['max_rent_days']),
-                float(row['daily_rate']),
-                row['fuel_type']
-            ))
-
-    cur.executemany('''
-        INSERT INTO cars (car_id, make, model, year, mileage, available_now, 
+#The file is streamed in chunks, each chunk is converted (optionally in a process pool) and
+#written in its own transaction, so memory use does not depend on the size of the file.
+IMPORT_CHUNK_SIZE = 1000
+
+_IMPORT_SQL = {
+    'fail': 'INSERT INTO',
+    'skip': 'INSERT OR IGNORE INTO',
+    'upsert': 'INSERT INTO',
+}
+#available_now is left alone, it belongs to the rentals, and version moves on so cached copies are refreshed
+_UPSERT_CLAUSE = '''
+    ON CONFLICT (car_id) DO UPDATE SET
+        make = excluded.make, model = excluded.model, year = excluded.year, mileage = excluded.mileage,
+        min_rent_days = excluded.min_rent_days, max_rent_days = excluded.max_rent_days,
+        daily_rate = excluded.daily_rate, fuel_type = excluded.fuel_type, version = version + 1
+'''
+
+
+def _convert_car_row(row):                           #One csv row to a typed tuple, raises ValueError on bad data
+    car = (
+        row['car_id'].strip(),
+        row['make'].strip(),
+        row['model'].strip(),
+        int(row['year']),
+        int(row['mileage']),
+        int(row['available_now']),
+        int(row['min_rent_days']),
+        int(row['max_rent_days']),
+        float(row['daily_rate']),
+        row['fuel_type'].strip()
+    )
+    if not car[0]:
+        raise ValueError("car_id is empty")
+    if car[5] not in (0, 1):
+        raise ValueError("available_now must be 0 or 1")
+    if car[6] > car[7]:
+        raise ValueError("min_rent_days is greater than max_rent_days")
+    return car
+
+
+def _convert_car_chunk(chunk):                       #Runs in the worker pool, returns (cars, rejected rows)
+    cars, rejected = [], []
+    for line_no, row in chunk:
+        try:
+            cars.append(_convert_car_row(row))
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            rejected.append((line_no, f"{type(e).__name__}: {e}"))
+    return cars, rejected
+
+
+def _read_chunks(reader, chunk_size):
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+#on_conflict: 'skip' keeps the existing car, 'upsert' overwrites its details but not availability, 'fail' aborts on the first duplicate.
+#progress, if given, is called after every chunk with the report so far.
+#Returns a report dict: rows read, cars written, duplicates skipped and (line, reason) for rejected rows.
+@instrumented
+def import_cars_from_csv(csv_filename, chunk_size=IMPORT_CHUNK_SIZE, on_conflict='skip', workers=0, progress=None):
+    if on_conflict not in _IMPORT_SQL:
+        raise ValueError(f"on_conflict must be one of {sorted(_IMPORT_SQL)}")
+    sql = f'''
+        {_IMPORT_SQL[on_conflict]} cars (car_id, make, model, year, mileage, available_now,
                               min_rent_days, max_rent_days, daily_rate, fuel_type)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', to_insert)
-    conn.commit()
-    conn.close()
+    ''' + (_UPSERT_CLAUSE if on_conflict == 'upsert' else '')
+    report = {'read': 0, 'written': 0, 'skipped': 0, 'rejected': []}
+    conn = get_connection()
+
+    def write(converted):
+        cars, rejected = converted
+        with transaction():
+            #rowcount leaves out the rows written by triggers, total_changes would not
+            written = max(conn.executemany(sql, cars).rowcount, 0)
+        report['read'] += len(cars) + len(rejected)
+        report['written'] += written
+        report['skipped'] += len(cars) - written
+        report['rejected'].extend(rejected)
+        if progress:
+            progress(report)
+
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as file:
+        chunks = _read_chunks(csv.DictReader(file), chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                write(_convert_car_chunk(chunk))
+        else:
+            #Keep at most two chunks per worker in flight and write them back in file order
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(_convert_car_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    return report
 
 
+@instrumented_read
 def get_all_cars_from_db():                      #return a list of all cars
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM cars')
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
+@instrumented_read
 def get_car_by_id_from_db(car_id):               #return a single car accoring to its id
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM cars WHERE car_id = ?', (car_id,))
     row = cur.fetchone()
-    conn.close()
     return row
 
+#Available cars matching the filters, one page at a time.
+#Paging is keyset based: pass the last car_id of the previous page as after_car_id.
+@instrumented_read
+def search_available_cars_in_db(fuel_type=None, make=None, min_rate=None, max_rate=None,
+                                rent_days=None, after_car_id=None, limit=50):
+    conditions = ['available_now = 1']
+    params = []
+    if fuel_type:
+        conditions.append('fuel_type = ? COLLATE NOCASE')
+        params.append(fuel_type)
+    if make:
+        conditions.append('make = ? COLLATE NOCASE')
+        params.append(make)
+    if min_rate is not None:
+        conditions.append('daily_rate >= ?')
+        params.append(min_rate)
+    if max_rate is not None:
+        conditions.append('daily_rate <= ?')
+        params.append(max_rate)
+    if rent_days is not None:
+        conditions.append('min_rent_days <= ? AND max_rent_days >= ?')
+        params.extend([rent_days, rent_days])
+    if after_car_id is not None:
+        conditions.append('car_id > ?')
+        params.append(after_car_id)
+    params.append(limit)
+
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute(f'SELECT * FROM cars WHERE {" AND ".join(conditions)} ORDER BY car_id LIMIT ?', params)
+    return cur.fetchall()
+
 ##Adding, updating, or deleting car data 
 
+@instrumented
 def insert_car_into_db(car_data):
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         INSERT INTO cars (car_id, make, model, year, mileage, available_now, 
@@ -119,145 +564,487 @@ def insert_car_into_db(car_data):
     ''', (car_data['car_id'], car_data['make'], car_data['model'], car_data['year'],
           car_data['mileage'], car_data['available_now'], car_data['min_rent_days'],
           car_data['max_rent_days'], car_data['daily_rate'], car_data['fuel_type']))
-    conn.commit()
-    conn.close()
+    _commit(conn)
 
 
+@instrumented
 def update_car_in_db(car_id, new_data):
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         UPDATE cars
         SET make = ?, model = ?, year = ?, mileage = ?, available_now = ?, 
-            min_rent_days = ?, max_rent_days = ?, daily_rate = ?, fuel_type = ?
+            min_rent_days = ?, max_rent_days = ?, daily_rate = ?, fuel_type = ?,
+            version = version + 1
         WHERE car_id = ?
     ''', (new_data['make'], new_data['model'], new_data['year'], new_data['mileage'],
           new_data['available_now'], new_data['min_rent_days'], new_data['max_rent_days'],
           new_data['daily_rate'], new_data['fuel_type'], car_id))
-    conn.commit()
-    conn.close()
+    _commit(conn)
 
 
+@instrumented
 def delete_car_from_db(car_id):
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('DELETE FROM cars WHERE car_id = ?', (car_id,))
-    conn.commit()
-    conn.close()
+    _commit(conn)
 
 
-def update_car_availability_in_db(car_id, availability_status):
-    conn = connect_db()
+@instrumented
+def update_car_availability_in_db(car_id, availability_status):     #Returns the car's new version, None if not found
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         UPDATE cars
-        SET available_now = ?
+        SET available_now = ?, version = version + 1
         WHERE car_id = ?
+        RETURNING version
     ''', (int(availability_status), car_id))
-    conn.commit()
-    conn.close()
+    row = cur.fetchone()
+    _commit(conn)
+    return row[0] if row else None
+
+
+#Compare-and-set booking: takes the car only if it is still available (and, when expected_version
+#is given, nobody changed it since it was read). Returns the new version, or None if another
+#booking or edit won the race.
+@instrumented
+def reserve_car_in_db(car_id, expected_version=None):
+    conn = get_connection()
+    cur = conn.cursor()
+    sql = '''
+        UPDATE cars
+        SET available_now = 0, version = version + 1
+        WHERE car_id = ? AND available_now = 1
+    '''
+    params = [car_id]
+    if expected_version is not None:
+        sql += ' AND version = ?'
+        params.append(expected_version)
+    cur.execute(sql + ' RETURNING version', params)
+    row = cur.fetchone()
+    _commit(conn)
+    return row[0] if row else None
+
+
+#Only the fields an admin edits, so a booking made elsewhere keeps its available_now flag
+@instrumented
+def update_car_rate_and_mileage_in_db(car_id, new_mileage, new_daily_rate):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        UPDATE cars
+        SET mileage = ?, daily_rate = ?, version = version + 1
+        WHERE car_id = ?
+    ''', (new_mileage, new_daily_rate, car_id))
+    _commit(conn)
 
 
+@instrumented
 def update_car_mileage_in_db(car_id, new_mileage):
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         UPDATE cars
-        SET mileage = ?
+        SET mileage = ?, version = version + 1
         WHERE car_id = ?
     ''', (new_mileage, car_id))
-    conn.commit()
-    conn.close()
+    _commit(conn)
 
 
 # User database operations, for registration and login details
-def insert_user_into_db(username, password, role):           #Creating new user login, storing in plain text to simplify the project.
-    conn = connect_db()
+@instrumented
+def insert_user_into_db(username, password, role):           #Creating new user login, password is the PBKDF2 hash from security.py
+    conn = get_connection()                                      #Returns False if the username is already taken
     cur = conn.cursor()
     cur.execute('''
-        INSERT INTO users (username, password, role)
+        INSERT OR IGNORE INTO users (username, password, role)
         VALUES (?, ?, ?)
     ''', (username, password, role))
-    conn.commit()
-    conn.close()
+    _commit(conn)
+    return cur.rowcount == 1
 
 
+@instrumented
+def update_user_password_in_db(username, password):           #Replacing a stored password hash, e.g. after a cost upgrade
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute('UPDATE users SET password = ? WHERE username = ?', (password, username))
+    _commit(conn)
+
+
+@instrumented_read
 def get_user_from_db(username):                              #Fetching one user via username
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM users WHERE username = ?', (username,))
     row = cur.fetchone()
-    conn.close()
     return row
 
 
+@instrumented_read
+def admin_exists_in_db():
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT 1 FROM users WHERE role = 'admin' LIMIT 1")
+    return cur.fetchone() is not None
+
+
+@instrumented_read
 def get_all_users_from_db():                                 #Fetching all users data
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM users')
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
 # Rental database operations                                     
+@instrumented
 def insert_rental_into_db(rental_data):                      #Creating new rental records, such as R-001, test, Car-001 etc                      
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         INSERT INTO rentals (rental_id, customer_username, car_id, start_date, end_date, 
-                           total_cost, additional_fees, status, return_date)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                           total_cost, additional_fees, status, return_date, submitted_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (rental_data['rental_id'], rental_data['customer_username'], rental_data['car_id'],
           rental_data['start_date'], rental_data['end_date'], rental_data['total_cost'],
-          rental_data['additional_fees'], rental_data['status'], rental_data['return_date']))
-    conn.commit()
-    conn.close()
+          rental_data['additional_fees'], rental_data['status'], rental_data['return_date'],
+          rental_data.get('submitted_at')))
+    _commit(conn)
 
 
+@instrumented_read
 def get_all_rentals_from_db():                               #Managing rental records in different ways
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM rentals')
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
+@instrumented_read
+def get_rentals_page_from_db(after_rowid=0, limit=500):     #Keyset paging over rowid, returns (rows, last rowid)
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT rowid, * FROM rentals WHERE rowid > ? ORDER BY rowid LIMIT ?', (after_rowid, limit))
+    rows = cur.fetchall()
+    if not rows:
+        return [], after_rowid
+    return [row[1:] for row in rows], rows[-1][0]
+
+
+@instrumented_read
+def get_max_rental_number_from_db():                         #Highest numeric part of the R-xxx rental ids, 0 if none
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(CAST(SUBSTR(rental_id, 3) AS INTEGER)) FROM rentals WHERE rental_id LIKE 'R-%'")
+    row = cur.fetchone()
+    return row[0] or 0
+
+
+#Lookups by rental id, customer and closed status, and the analytics facts, also see archived rentals.
+#Every other query only reads the hot rentals table.
+RENTAL_COLUMNS = ('rental_id, customer_username, car_id, start_date, end_date, total_cost, additional_fees, '
+                  'status, return_date, submitted_at, decided_at')
+ARCHIVED_STATUSES = ('returned', 'rejected')       #Only closed rentals are ever archived
+ALL_RENTALS_SQL = f'(SELECT {RENTAL_COLUMNS} FROM rentals UNION ALL SELECT {RENTAL_COLUMNS} FROM rentals_archive)'
+
+
+@instrumented_read
 def get_rental_by_id_from_db(rental_id):
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
     cur.execute('SELECT * FROM rentals WHERE rental_id = ?', (rental_id,))
     row = cur.fetchone()
-    conn.close()
+    if row is None:
+        cur.execute(f'SELECT {RENTAL_COLUMNS} FROM rentals_archive WHERE rental_id = ?', (rental_id,))
+        row = cur.fetchone()
     return row
 
 
+@instrumented_read
 def get_rentals_by_customer_from_db(customer_username):
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
-    cur.execute('SELECT * FROM rentals WHERE customer_username = ?', (customer_username,))
+    cur.execute(f'SELECT * FROM {ALL_RENTALS_SQL} WHERE customer_username = ?', (customer_username,))
+    rows = cur.fetchall()
+    return rows
+
+
+@instrumented_read
+def get_rentals_by_car_from_db(car_id):
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM rentals WHERE car_id = ?', (car_id,))
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
+@instrumented_read
+def rental_overlaps_in_db(car_id, start_date, end_date):     #Any pending/approved rental of the car overlapping [start, end)
+    conn = get_read_connection()
+    cur = conn.cursor()
+    cur.execute('''
+        SELECT 1 FROM rentals
+        WHERE car_id = ? AND status IN ('pending', 'approved') AND start_date < ? AND end_date > ?
+        LIMIT 1
+    ''', (car_id, str(end_date), str(start_date)))
+    return cur.fetchone() is not None
+
+
+@instrumented_read
 def get_rentals_by_status_from_db(status):
-    conn = connect_db()
+    conn = get_read_connection()
     cur = conn.cursor()
-    cur.execute('SELECT * FROM rentals WHERE status = ?', (status,))
+    if status in ARCHIVED_STATUSES:
+        cur.execute(f'SELECT * FROM {ALL_RENTALS_SQL} WHERE status = ?', (status,))
+    else:
+        cur.execute('SELECT * FROM rentals WHERE status = ?', (status,))
     rows = cur.fetchall()
-    conn.close()
     return rows
 
 
+@instrumented
 def update_rental_status_in_db(rental_id, status, return_date=None):
-    conn = connect_db()
+    conn = get_connection()
     cur = conn.cursor()
     cur.execute('''
         UPDATE rentals
         SET status = ?, return_date = ?
         WHERE rental_id = ?
     ''', (status, return_date, rental_id))
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    _commit(conn)
+
+
+#Batch versions for processing many rental requests in one transaction
+SQL_VARIABLE_CHUNK = 900                             #Stay well under SQLite's bound-parameter limit
+
+
+@instrumented_read
+def get_pending_rental_ids_in_db(rental_ids):        #Which of the given rentals are still pending
+    conn = get_read_connection()
+    rental_ids = list(rental_ids)
+    pending = set()
+    for i in range(0, len(rental_ids), SQL_VARIABLE_CHUNK):
+        chunk = rental_ids[i:i + SQL_VARIABLE_CHUNK]
+        placeholders = ', '.join('?' * len(chunk))
+        cur = conn.execute(f"SELECT rental_id FROM rentals WHERE status = 'pending' AND rental_id IN ({placeholders})",
+                           chunk)
+        pending.update(row[0] for row in cur)
+    return pending
+
+
+@instrumented
+def update_rental_statuses_in_db(rental_ids, status, return_date=None, decided_at=None):
+    conn = get_connection()
+    conn.executemany('''
+        UPDATE rentals
+        SET status = ?, return_date = ?, decided_at = COALESCE(?, decided_at)
+        WHERE rental_id = ?
+    ''', [(status, return_date, decided_at, rental_id) for rental_id in rental_ids])
+    _commit(conn)
+
+
+#Gives cars back after their rentals closed. A car stays taken while another of its rentals has started:
+#an approved one until it is returned, a pending one until its end date. Returns {car_id: new version}
+#for the cars it freed.
+@instrumented
+def release_cars_in_db(car_ids, today):
+    conn = get_connection()
+    today = str(today)
+    released = {}
+    for car_id in car_ids:
+        row = conn.execute('''
+            UPDATE cars
+            SET available_now = 1, version = version + 1
+            WHERE car_id = ? AND available_now = 0 AND NOT EXISTS (
+                SELECT 1 FROM rentals
+                WHERE rentals.car_id = cars.car_id AND start_date <= ?
+                  AND (status = 'approved' OR (status = 'pending' AND end_date > ?))
+            )
+            RETURNING version
+        ''', (car_id, today, today)).fetchone()
+        if row:
+            released[car_id] = row[0]
+    _commit(conn)
+    return released
+
+
+#Analytics facts: one row per rental joined with the car attributes reports are grouped by.
+#(number, rental_id, car_id, make, fuel_type, status, start_date, end_date, total_cost, submitted_at, decided_at)
+_RENTAL_FACTS_SQL = f'''
+    SELECT {RENTAL_NUMBER_SQL}, r.rental_id, r.car_id, c.make, c.fuel_type, r.status, r.start_date,
+           r.end_date, r.total_cost, r.submitted_at, r.decided_at
+    FROM {ALL_RENTALS_SQL} r LEFT JOIN cars c ON c.car_id = r.car_id
+'''
+
+
+#Every rental fact and the last change event id, read from one snapshot so the two always agree
+@instrumented_read
+def get_rental_facts_snapshot_in_db():               #(facts, last event id)
+    conn = get_read_connection()
+    own_snapshot = not conn.in_transaction
+    if own_snapshot:
+        conn.execute('BEGIN')
+    try:
+        last_event_id = conn.execute('SELECT COALESCE(MAX(event_id), 0) FROM change_events').fetchone()[0]
+        rows = conn.execute(_RENTAL_FACTS_SQL).fetchall()
+    finally:
+        if own_snapshot:
+            conn.execute('COMMIT')
+    return rows, last_event_id
+
+
+@instrumented_read
+def get_rental_facts_by_ids_in_db(rental_ids):
+    conn = get_read_connection()
+    rental_ids = list(rental_ids)
+    rows = []
+    for i in range(0, len(rental_ids), SQL_VARIABLE_CHUNK):
+        chunk = rental_ids[i:i + SQL_VARIABLE_CHUNK]
+        placeholders = ', '.join('?' * len(chunk))
+        rows.extend(conn.execute(_RENTAL_FACTS_SQL + f' WHERE r.rental_id IN ({placeholders})', chunk))
+    return rows
+
+
+@instrumented_read
+def count_cars_in_db():
+    conn = get_read_connection()
+    return conn.execute('SELECT COUNT(*) FROM cars').fetchone()[0]
+
+
+@instrumented_read
+def count_rented_cars_in_db():                       #(cars in the fleet, cars not available now) for demand pricing
+    conn = get_read_connection()
+    return conn.execute('SELECT COUNT(*), COUNT(*) - COALESCE(SUM(available_now), 0) FROM cars').fetchone()
+
+
+#Archival: closed rentals older than a cutoff are moved to rentals_archive in batches,
+#each batch in its own transaction so the write lock is never held for long.
+ARCHIVE_BATCH_SIZE = 500
+_CLOSED_ON_SQL = 'COALESCE(return_date, SUBSTR(decided_at, 1, 10), end_date)'     #The day a rental was closed
+
+
+@instrumented
+def archive_closed_rentals_in_db(cutoff, batch_size=ARCHIVE_BATCH_SIZE):    #Rentals closed before cutoff, returns how many moved
+    conn = get_connection()
+    archived_at = datetime.now().isoformat(timespec='seconds')
+    moved = 0
+    while True:
+        with transaction():
+            rental_ids = [row[0] for row in conn.execute(f'''
+                SELECT rental_id FROM rentals
+                WHERE status IN ('returned', 'rejected') AND {_CLOSED_ON_SQL} < ?
+                LIMIT ?
+            ''', (str(cutoff), batch_size))]
+            if rental_ids:
+                placeholders = ', '.join('?' * len(rental_ids))
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO rentals_archive ({RENTAL_COLUMNS}, archived_at)
+                    SELECT {RENTAL_COLUMNS}, ? FROM rentals WHERE rental_id IN ({placeholders})
+                ''', [archived_at, *rental_ids])
+                conn.execute(f'DELETE FROM rentals WHERE rental_id IN ({placeholders})', rental_ids)
+        moved += len(rental_ids)
+        if len(rental_ids) < batch_size:
+            return moved
+
+
+@instrumented_read
+def count_archived_rentals_in_db():
+    conn = get_read_connection()
+    return conn.execute('SELECT COUNT(*) FROM rentals_archive').fetchone()[0]
+
+
+
+#Change event log, see _migration_change_events
+@instrumented_read
+def get_change_events_after_in_db(after_event_id, limit=500, entities=None):   #Oldest first
+    conn = get_read_connection()
+    if entities:
+        placeholders = ', '.join('?' * len(entities))
+        cur = conn.execute(f'''
+            SELECT event_id, entity, entity_id, action, payload, created_at FROM change_events
+            WHERE event_id > ? AND entity IN ({placeholders}) ORDER BY event_id LIMIT ?
+        ''', (after_event_id, *entities, limit))
+    else:
+        cur = conn.execute('''
+            SELECT event_id, entity, entity_id, action, payload, created_at FROM change_events
+            WHERE event_id > ? ORDER BY event_id LIMIT ?
+        ''', (after_event_id, limit))
+    return cur.fetchall()
+
+
+@instrumented_read
+def get_last_event_id_in_db():
+    conn = get_read_connection()
+    return conn.execute('SELECT COALESCE(MAX(event_id), 0) FROM change_events').fetchone()[0]
+
+
+@instrumented_read
+def get_event_cursor_in_db(subscriber):              #None for a subscriber that never saved a cursor
+    conn = get_read_connection()
+    row = conn.execute('SELECT last_event_id FROM event_cursors WHERE subscriber = ?', (subscriber,)).fetchone()
+    return row[0] if row else None
+
+
+@instrumented
+def save_event_cursor_in_db(subscriber, last_event_id):
+    conn = get_connection()
+    conn.execute('''
+        INSERT INTO event_cursors (subscriber, last_event_id) VALUES (?, ?)
+        ON CONFLICT(subscriber) DO UPDATE SET last_event_id = MAX(last_event_id, excluded.last_event_id)
+    ''', (subscriber, last_event_id))
+    _commit(conn)
+
+
+#Read workers
+#A process pool whose workers answer the read helpers from their own read-only connections, so listing
+#traffic can use more than one core. Writes never go through the pool, they stay with the calling process.
+#CarRentalSystem.use_read_pool sends the fleet listings here, AsyncCarRentalSystem does so with read_workers.
+READ_HELPERS = frozenset([
+    'get_all_cars_from_db', 'get_car_by_id_from_db', 'search_available_cars_in_db', 'get_user_from_db',
+    'admin_exists_in_db', 'get_all_users_from_db', 'get_all_rentals_from_db', 'get_rentals_page_from_db',
+    'get_rental_by_id_from_db', 'get_rentals_by_customer_from_db', 'get_rentals_by_car_from_db',
+    'get_rentals_by_status_from_db', 'get_rental_facts_snapshot_in_db', 'count_cars_in_db',
+])
+
+
+def _init_read_worker(db_name):
+    global DB_NAME, _local, _open_connections, _read_connections
+    DB_NAME = db_name
+    #A forked worker inherits the parent's connection objects, it must never use or close them
+    _local = threading.local()
+    _open_connections = []
+    _read_connections = set()
+
+
+def _run_read_helper(name, args, kwargs):
+    return globals()[name](*args, **kwargs)
+
+
+class ReadWorkerPool:
+
+    def __init__(self, workers=None, mp_context=None):
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                             initializer=_init_read_worker, initargs=(os.path.abspath(DB_NAME),))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def submit(self, helper, *args, **kwargs):       #helper is a read helper or its name, returns a Future of its rows
+        name = helper if isinstance(helper, str) else helper.__name__
+        if name not in READ_HELPERS:
+            raise ValueError(f"{name} is not a read-only database helper")
+        return self._executor.submit(_run_read_helper, name, args, kwargs)
+
+    def call(self, helper, *args, **kwargs):
+        return self.submit(helper, *args, **kwargs).result()
+
+    def close(self):
+        self._executor.shutdown()
@@ -0,0 +1,86 @@
+#Change event subscribers
+#Every insert, status change and delete of a rental, and every change to a car, is appended to the
+#change_events table by triggers (see database.py). A subscriber reads the log from its own cursor, so
+#cache invalidators, analytics or notifications only see what changed instead of re-reading whole tables.
+#
+#  subscriber = EventSubscriber('notifications', entities=['rental'])
+#  for event in subscriber.stream():
+#      ...
+#
+#Named subscribers keep their cursor in the event_cursors table and carry on where they stopped after a
+#restart, events are delivered at least once. A subscriber without a name keeps its cursor in memory.
+
+
+import json
+import time
+from collections import namedtuple
+
+import database
+
+
+POLL_INTERVAL = 0.5                                  #Seconds between checks while waiting for new events
+EVENT_BATCH_SIZE = 500
+
+ChangeEvent = namedtuple('ChangeEvent', ['event_id', 'entity', 'entity_id', 'action', 'data', 'created_at'])
+
+
+def _event_from_row(row):
+    event_id, entity, entity_id, action, payload, created_at = row
+    return ChangeEvent(event_id, entity, entity_id, action, json.loads(payload), created_at)
+
+
+class EventSubscriber:
+
+    #entities limits the events to 'rental' and/or 'car'. A new subscriber starts at the beginning of the
+    #log, or at its current end with from_start=False; a saved cursor always wins.
+    def __init__(self, name=None, entities=None, from_start=True, batch_size=EVENT_BATCH_SIZE):
+        self._name = name
+        self._entities = list(entities) if entities else None
+        self._batch_size = batch_size
+        saved = database.get_event_cursor_in_db(name) if name else None
+        if saved is not None:
+            self._cursor = saved
+        else:
+            self._cursor = 0 if from_start else database.get_last_event_id_in_db()
+
+    def get_cursor(self):
+        return self._cursor
+
+    #Next batch after the cursor, oldest first. The cursor only moves on commit(), so a consumer that
+    #fails part way through sees the same events again.
+    def read(self, limit=None):
+        rows = database.get_change_events_after_in_db(self._cursor, limit or self._batch_size, self._entities)
+        return [_event_from_row(row) for row in rows]
+
+    def commit(self, event_id):                      #Everything up to and including event_id has been handled
+        if event_id <= self._cursor:
+            return
+        self._cursor = event_id
+        if self._name:
+            database.save_event_cursor_in_db(self._name, event_id)
+
+    #Waits until there are events after the cursor, up to timeout seconds (forever if None).
+    #Returns the batch without committing it, an empty list on timeout.
+    def poll(self, timeout=None, interval=POLL_INTERVAL):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = self.read()
+            if events:
+                return events
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                time.sleep(min(interval, remaining))
+            else:
+                time.sleep(interval)
+
+    #Yields events forever, or until idle_timeout seconds pass without any. A batch is committed once the
+    #consumer asks for the event after its last one.
+    def stream(self, idle_timeout=None, interval=POLL_INTERVAL):
+        while True:
+            events = self.poll(idle_timeout, interval)
+            if not events:
+                return
+            yield from events
+            self.commit(events[-1].event_id)
@@ -1,16 +1,56 @@
+import argparse
 import os
+import sys
 import database
+import batch
+import query_stats
 from system import CarRentalSystem
-from Utilities import (get_integer_input, get_float_input, get_yes_no_input)
+from datetime import date, timedelta
+from Utilities import (get_integer_input, get_float_input, get_yes_no_input, get_date_input)
 
 
-def main():
+CARS_PER_PAGE = 20
+
+
+def initialize_database(log=sys.stdout):
     if not os.path.exists(database.DB_NAME):
-        print("Database not found, initializing!")
+        print("Database not found, initializing!", file=log)
         database.create_tables()
-        database.import_cars_from_csv('seed_cars.csv')
-        print("Car data successfully imported from CSV to database.")
-        
+        report = database.import_cars_from_csv('seed_cars.csv')
+        print(f"{report['written']} cars successfully imported from CSV to database.", file=log)
+        for line_no, reason in report['rejected']:
+            print(f"Skipped CSV line {line_no}: {reason}", file=log)
+
+
+#Batch mode: python main.py --batch operations.jsonl [--output results.jsonl], "-" reads stdin.
+#Results go to stdout unless --output is given, the summary always goes to stderr.
+def run_batch_mode(args):
+    initialize_database(log=sys.stderr)
+    system = CarRentalSystem()
+    source = sys.stdin if args.batch == '-' else open(args.batch, encoding='utf-8')
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        total, failures = batch.run_batch(system, source, out, args.group_size)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+        database.close_connections()
+    print(f"{total} operations processed, {failures} failed.", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Car Rental System.")
+    parser.add_argument('--batch', metavar='FILE', help="run JSON-lines operations from FILE (- for stdin) instead of the menus")
+    parser.add_argument('--output', metavar='FILE', help="write batch results to FILE instead of stdout")
+    parser.add_argument('--group-size', type=int, default=batch.BATCH_GROUP_SIZE, help="batch operations per transaction")
+    args = parser.parse_args()
+    if args.batch:
+        sys.exit(run_batch_mode(args))
+
+    initialize_database()
     system = CarRentalSystem()
     current_user = None
 
@@ -33,7 +73,7 @@ def main():
                     print("\nLogin successful!")
 
                     if current_user.get_role() == 'admin':
-                        pending_count = len(system.get_rentals_by_status('pending'))
+                        pending_count = system.pending_request_count()
                         #Reminder for admin to manage pending bookings.
                         if pending_count > 0:
                             print(f"*Reminder*: You have {pending_count} pending rental requests.")
@@ -60,6 +100,7 @@ def main():
             #Exit the project.
             elif choice == '3':
                 print("Thank you for using the car rental system, goodbye!")
+                database.close_connections()
                 break
             else:
                 print("Invalid input, please try again later.")
@@ -74,11 +115,11 @@ def main():
 
             if current_user.get_role() == 'admin':
                 handle_admin_actions(system, choice)
-                if choice == '7': #Logout
+                if choice == '10': #Logout
                     current_user = None
             elif current_user.get_role() == 'customer':
                 handle_customer_actions(system, current_user, choice)
-                if choice == '5': #Logout
+                if choice == '6': #Logout
                     current_user = None
 
 
@@ -151,15 +192,16 @@ def handle_admin_actions(system, choice):
         print(f"\n{message}")
     elif choice == '5':
         print("\n--- All Rental Records ---")
-        rentals = system.get_all_rentals()
-        if not rentals:
-            print("No rental records currently.")
-        else:
-            for rental in rentals:
+        found = False
+        for page in system.iter_rental_pages():
+            found = True
+            for rental in page:
                 print(rental.get_details())
+        if not found:
+            print("No rental records currently.")
     elif choice == '6':
         print("\n--- Manage Rental Requests ---")
-        pending_rentals = system.get_rentals_by_status('pending')
+        pending_rentals = system.get_pending_requests()
         if not pending_rentals:
             print("No pending rental requests currently.")
         else:
@@ -167,12 +209,43 @@ def handle_admin_actions(system, choice):
             for rental in pending_rentals:
                 print(rental.get_details())
 
-            rental_id = input("Please enter the rental ID to process (e.g., R-001): ")
+            id_text = input("Please enter the rental ID(s) to process, separated by commas (e.g., R-001, R-002): ")
             action = input("Please enter action (approve/reject): ")
 
-            success, message = system.manage_rental_request(rental_id, action)
-            print(f"\n{message}")
+            rental_ids = [rental_id.strip() for rental_id in id_text.split(',') if rental_id.strip()]
+            results = system.manage_rental_requests(rental_ids, action)
+            print()
+            for success, message in results.values():
+                print(f"{message}" if len(results) == 1 else f"- {message}")
     elif choice == '7':
+        print("\n--- Rental Analytics ---")
+        report = system.get_rental_analytics()
+        print(f"Total revenue: ${report['revenue_total']:.2f} from {report['rentals_counted']} rentals")
+        print(f"Fleet utilization: {report['utilization_rate']:.1%}")
+        print(f"Average rental length: {report['average_rent_days']:.1f} days")
+        if report['average_approval_hours'] is not None:
+            print(f"Average approval time: {report['average_approval_hours']:.1f} hours")
+        for title, key in (("make", 'revenue_by_make'), ("fuel type", 'revenue_by_fuel_type'), ("car", 'revenue_by_car')):
+            print(f"\nRevenue by {title}:")
+            for name, row in report[key].items():
+                print(f"  {name}: ${row['revenue']:.2f} ({row['rentals']} rentals, {row['rent_days']} days)")
+    elif choice == '8':
+        print("\n--- Query Statistics ---")
+        if not query_stats.query_stats_enabled():
+            print("Query statistics are off.")
+            if get_yes_no_input("Start collecting them now? (y/n): "):
+                query_stats.enable_query_stats()
+                print("Collecting, use the system for a while and check back here.")
+        elif not query_stats.get_query_stats():
+            print("No database calls recorded yet.")
+        else:
+            print(query_stats.dump_query_stats())
+    elif choice == '9':
+        print("\n--- Archive Rental Records ---")
+        days = get_integer_input("Archive returned/rejected rentals closed more than how many days ago? ", 1)
+        moved = system.archive_closed_rentals(days)
+        print(f"{moved} rental records moved to the archive.")
+    elif choice == '10':
         print("\nLogging out...")
     else:
         print("\nInvalid choice, please try again.")
@@ -183,12 +256,15 @@ def handle_admin_actions(system, choice):
 def handle_customer_actions(system, user, choice):
     if choice == '1':
         print("\n--- Available Cars List ---")
-        cars = system.get_available_cars()
+        cars, cursor = system.search_available_cars(page_size=CARS_PER_PAGE)
         if not cars:
             print("Sorry, no cars are currently available.")
-        else:
+        while cars:
             for car in cars:
                 print(car.get_details())
+            if cursor is None or not get_yes_no_input("Show more cars? (y/n): "):
+                break
+            cars, cursor = system.search_available_cars(page_size=CARS_PER_PAGE, cursor=cursor)
     elif choice == '2':
         print("\n--- Rent a Car ---")
         car_id = input("Please enter the car ID you want to rent: ")
@@ -200,13 +276,19 @@ def handle_customer_actions(system, user, choice):
 
         print(f"You selected {car.get_make()} {car.get_model()}, daily rate is ${car.get_daily_rate():.2f}.")
         days = get_integer_input("Please enter rental days: ")
+        start_date = get_date_input("Start date (YYYY-MM-DD, leave empty for today): ", date.today(), date.today())
 
-        # Calculate total cost
-        total_cost = days * car.get_daily_rate()
-        print(f"Total rental cost is ${total_cost:.2f}.")
+        quote, message = system.quote_rental(car_id, days, start_date)
+        print(message)
+        if not quote:
+            input("Press Enter to return...")
+            return
+        if quote['duration_multiplier'] != 1.0 or quote['demand_multiplier'] != 1.0:
+            print(f"(average ${quote['average_daily_rate']:.2f}/day, includes a {quote['duration_multiplier']:.2f}x "
+                  f"duration and {quote['demand_multiplier']:.2f}x demand adjustment)")
 
         if get_yes_no_input("Confirm booking? (y/n): "):
-            rental, message = system.book_car(user.get_username(), car_id, days, 0.0)
+            rental, message = system.book_car(user.get_username(), car_id, days, 0.0, start_date)
             print(f"\n{message}")
         else:
             print("\nBooking cancelled.")
@@ -227,6 +309,15 @@ def handle_customer_actions(system, user, choice):
         if success:
             print(f"Total rental cost is ${rental_cost:.2f}.")
     elif choice == '5':
+        print("\n--- Find Cars Free For My Dates ---")
+        start_date = get_date_input("Start date (YYYY-MM-DD, leave empty for today): ", date.today(), date.today())
+        days = get_integer_input("Please enter rental days: ", 1)
+        cars = system.get_cars_free_between(start_date, start_date + timedelta(days=days))
+        if not cars:
+            print("Sorry, no cars are free for those dates.")
+        for car in cars:
+            print(car.get_details())
+    elif choice == '6':
         print("\nLogging out...")
     else:
         print("\nInvalid choice, please try again.")
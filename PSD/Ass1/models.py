@@ -3,10 +3,12 @@
 
 import abc
 from datetime import date
+from security import verify_password
 
 #Abstraction base class
 class User(abc.ABC):
 
+    #password is the stored hash (or a legacy plain text value), never a freshly typed password
     def __init__(self, username, password, role):
         self._username = username
         self._password = password
@@ -20,7 +22,13 @@ class User(abc.ABC):
         return self._role
 
     def check_password(self, password):
-        return self._password == password
+        return verify_password(password, self._password)
+
+    def get_password_hash(self):
+        return self._password
+
+    def set_password_hash(self, password_hash):
+        self._password = password_hash
 
     @abc.abstractmethod
     def display_menu(self):
@@ -41,7 +49,10 @@ class Admin(User):
         print("4. Delete car")
         print("5. View all rental records")
         print("6. Manage rental requests")
-        print("7. Logout")
+        print("7. View rental analytics")
+        print("8. View query statistics")
+        print("9. Archive old rental records")
+        print("10. Logout")
         print("--------------------")
 
 
@@ -57,15 +68,19 @@ class Customer(User):
         print("2. Rent a car")
         print("3. View my rental records")
         print("4. Return car")
-        print("5. Logout")
+        print("5. Find cars free for my dates")
+        print("6. Logout")
         print("------------------")
 
 
 class Car:
+    #__slots__ keeps each car small, there is no per-instance __dict__
+    __slots__ = ('_car_id', '_make', '_model', '_year', '_mileage', '_available_now',
+                 '_min_rent_days', '_max_rent_days', '_daily_rate', '_fuel_type', '_version')
     
     #Encapsulation with protected attributes, getter and setter methods.
     def __init__(self, car_id, make, model, year, mileage, available_now, min_rent_days, max_rent_days, daily_rate,
-                 fuel_type):
+                 fuel_type, version=0):
         self._car_id = car_id
         self._make = make
         self._model = model
@@ -76,6 +91,17 @@ class Car:
         self._max_rent_days = int(max_rent_days)
         self._daily_rate = float(daily_rate)
         self._fuel_type = fuel_type
+        self._version = int(version)             #Database row version, used for optimistic locking
+
+    #Fast constructor for a cars table row, SQLite already returns typed values so nothing is converted
+    @classmethod
+    def from_row(cls, row):
+        car = cls.__new__(cls)
+        (car._car_id, car._make, car._model, car._year, car._mileage, available_now,
+         car._min_rent_days, car._max_rent_days, car._daily_rate, car._fuel_type) = row[:10]
+        car._available_now = available_now == 1
+        car._version = row[10] if len(row) > 10 else 0
+        return car
 
     def get_car_id(self):
         return self._car_id
@@ -101,6 +127,12 @@ class Car:
     def set_availability(self, status: bool):
         self._available_now = status
 
+    def get_version(self):
+        return self._version
+
+    def set_version(self, version):
+        self._version = version
+
     def get_min_rent_days(self):
         return self._min_rent_days
 
@@ -132,14 +164,12 @@ class Car:
 
 #Encapsulation to manage rental booking details
 class Rental:
-    _next_id = 1
-
-    def __init__(self, customer_username, car_id, start_date, end_date, total_cost, additional_fees, rental_id=None):
-        if rental_id:
-            self._rental_id = rental_id
-        else:
-            self._rental_id = f"R-{Rental._next_id:03d}"
-            Rental._next_id += 1
+    __slots__ = ('_rental_id', '_customer_username', '_car_id', '_start_date', '_end_date',
+                 '_total_cost', '_additional_fees', '_status', '_return_date')
+
+    #rental_id comes from the database sequence (see database.IdBlockAllocator), never from a counter here
+    def __init__(self, customer_username, car_id, start_date, end_date, total_cost, additional_fees, rental_id):
+        self._rental_id = rental_id
         self._customer_username = customer_username
         self._car_id = car_id
         self._start_date = start_date
@@ -148,7 +178,14 @@ class Rental:
         self._additional_fees = additional_fees
         self._status = "pending"               
         self._return_date = None
-    #Generate rental id automatically like R-001
+
+    #Fast constructor for a rentals table row, keeps the stored status and return date
+    @classmethod
+    def from_row(cls, row):
+        rental = cls.__new__(cls)
+        (rental._rental_id, rental._customer_username, rental._car_id, rental._start_date, rental._end_date,
+         rental._total_cost, rental._additional_fees, rental._status, rental._return_date) = row[:9]
+        return rental
     
     
     def get_rental_id(self):
@@ -160,6 +197,12 @@ class Rental:
     def get_customer(self):
         return self._customer_username
 
+    def get_start_date(self):
+        return self._start_date
+
+    def get_end_date(self):
+        return self._end_date
+
     def get_total_cost(self):
         return self._total_cost
 
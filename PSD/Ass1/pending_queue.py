@@ -0,0 +1,66 @@
+#Pending rental requests waiting for an admin
+#Kept oldest submission first, so counting them is O(1) and the next request to handle is at the front.
+#The system adds a request when it is booked and drops it when it is approved or rejected; changes made by
+#other processes arrive through the change event log (see CarRentalSystem._sync_pending_requests).
+
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class PendingRequestQueue:
+
+    def __init__(self):
+        self._requests = OrderedDict()               #rental_id -> (order key, Rental), oldest submission first
+        self._last_key = None
+        self._changed = threading.Condition()
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __contains__(self, rental_id):
+        return rental_id in self._requests
+
+    #submitted_at is an ISO timestamp; rentals from before it was recorded sort first, by rental number
+    def add(self, rental, submitted_at=None):
+        rental_id = rental.get_rental_id()
+        number = rental_id[2:]
+        key = (submitted_at or '', int(number) if number.isdigit() else 0)
+        with self._changed:
+            if rental_id in self._requests:
+                return
+            self._requests[rental_id] = (key, rental)
+            if self._last_key is not None and key < self._last_key:
+                #Arrived out of order, e.g. from another process; rare, so a re-sort is fine
+                self._requests = OrderedDict(sorted(self._requests.items(), key=lambda item: item[1][0]))
+            else:
+                self._last_key = key
+            self._changed.notify_all()
+
+    def discard(self, rental_id):
+        with self._changed:
+            self._requests.pop(rental_id, None)
+
+    def oldest(self, limit=None):                    #Pending rentals, oldest submission first
+        with self._changed:
+            rentals = [rental for _, rental in self._requests.values()]
+        return rentals if limit is None else rentals[:limit]
+
+    #Blocks until there is a pending request and returns the oldest, or None after timeout seconds.
+    #refresh, if given, is called every poll_interval seconds to pick up requests made elsewhere.
+    def wait_for_next(self, timeout=None, refresh=None, poll_interval=0.5):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._changed:
+                if self._requests:
+                    return next(iter(self._requests.values()))[1]
+                wait = poll_interval if refresh else None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self._changed.wait(wait)
+            if refresh:
+                refresh()
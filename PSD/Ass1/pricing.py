@@ -0,0 +1,92 @@
+#Dynamic pricing
+#A rental is priced day by day from the car's daily_rate and the season of each day, then the whole rental
+#gets a duration discount and a demand surcharge. The seasonal part is precomputed per car as a prefix sum
+#over the coming year, so quoting any date range is two lookups instead of a rule evaluation per day.
+
+
+import threading
+from datetime import date, timedelta
+
+
+SEASONAL_MULTIPLIERS = {12: 1.15, 1: 1.15, 2: 1.15,                  #Summer peak
+                        6: 0.9, 7: 0.9, 8: 0.9}                       #Winter low season, other months 1.0
+DURATION_TIERS = [(14, 0.90), (7, 0.95)]             #(minimum rent days, multiplier), longest first
+DEMAND_TIERS = [(0.9, 1.25), (0.75, 1.15), (0.5, 1.05)]   #(minimum share of the fleet rented, multiplier)
+RATE_TABLE_DAYS = 366                                #Days from today covered by each precomputed table
+
+
+def seasonal_multiplier(day):
+    return SEASONAL_MULTIPLIERS.get(day.month, 1.0)
+
+
+def duration_multiplier(rent_days):
+    for min_days, multiplier in DURATION_TIERS:
+        if rent_days >= min_days:
+            return multiplier
+    return 1.0
+
+
+def demand_multiplier(utilization):
+    for min_utilization, multiplier in DEMAND_TIERS:
+        if utilization >= min_utilization:
+            return multiplier
+    return 1.0
+
+
+class RateTable:                                     #Seasonal day prices of one car, as prefix sums from start
+
+    def __init__(self, daily_rate, start, days=RATE_TABLE_DAYS):
+        self.daily_rate = daily_rate
+        self.start = start
+        self.prefix = [0.0]
+        for offset in range(days):
+            self.prefix.append(self.prefix[-1] + daily_rate * seasonal_multiplier(start + timedelta(days=offset)))
+
+    def price(self, start_date, rent_days):          #Sum of the day prices over [start_date, start_date + rent_days)
+        first = (start_date - self.start).days
+        last = first + rent_days
+        if 0 <= first and last < len(self.prefix):
+            return self.prefix[last] - self.prefix[first]
+        #Outside the table, e.g. a booking a year ahead, falls back to pricing each day
+        return sum(self.daily_rate * seasonal_multiplier(start_date + timedelta(days=offset))
+                   for offset in range(rent_days))
+
+
+class PricingEngine:
+
+    def __init__(self, table_days=RATE_TABLE_DAYS):
+        self._table_days = table_days
+        self._tables = {}                            #car_id -> RateTable
+        self._lock = threading.Lock()
+
+    def _rate_table(self, car):
+        today = date.today()
+        table = self._tables.get(car.get_car_id())
+        #A table is rebuilt when the car's rate changes or a new day starts
+        if table is None or table.daily_rate != car.get_daily_rate() or table.start != today:
+            with self._lock:
+                table = RateTable(car.get_daily_rate(), today, self._table_days)
+                self._tables[car.get_car_id()] = table
+        return table
+
+    def invalidate(self, car_id=None):               #Drop one car's table, or all of them
+        with self._lock:
+            if car_id is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(car_id, None)
+
+    def quote(self, car, start_date, rent_days, additional_fees=0.0, utilization=0.0):
+        base = self._rate_table(car).price(start_date, rent_days)
+        by_duration = duration_multiplier(rent_days)
+        by_demand = demand_multiplier(utilization)
+        rental_cost = round(base * by_duration * by_demand, 2)
+        return {'car_id': car.get_car_id(),
+                'start_date': start_date,
+                'rent_days': rent_days,
+                'average_daily_rate': round(rental_cost / rent_days, 2) if rent_days else 0.0,
+                'duration_multiplier': by_duration,
+                'demand_multiplier': by_demand,
+                'rental_cost': rental_cost,
+                'additional_fees': additional_fees,
+                'total_cost': round(rental_cost + additional_fees, 2)}
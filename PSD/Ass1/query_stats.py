@@ -0,0 +1,161 @@
+#Opt-in timing of the database helpers
+#Every helper in database.py is wrapped by instrumented(). While stats are off the wrapper only checks a flag,
+#once enabled each call records its latency, the rows it read or wrote and the code that called it.
+#Turn it on with enable_query_stats() or by starting the program with CAR_RENTAL_QUERY_STATS=1.
+
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+logger = logging.getLogger('car_rental.queries')
+
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)     #Upper bounds, the last bucket is everything slower
+DEFAULT_SLOW_QUERY_MS = 100.0
+TOP_CALL_SITES = 3                                   #Call sites listed per helper in the dump
+
+_enabled = os.environ.get('CAR_RENTAL_QUERY_STATS', '') not in ('', '0')
+_slow_query_ms = float(os.environ.get('CAR_RENTAL_SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS))
+_stats = {}                                          #helper name -> HelperStats
+_stats_lock = threading.Lock()
+_own_files = {os.path.abspath(__file__)}             #Frames skipped when looking for the call site
+
+
+class HelperStats:
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.call_sites = Counter()
+
+    def record(self, elapsed_ms, rows, call_site, slow):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.slow += slow
+        index = 0
+        while index < len(HISTOGRAM_BUCKETS_MS) and elapsed_ms > HISTOGRAM_BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.call_sites[call_site] += 1
+
+    def as_dict(self):
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        return {'calls': self.calls,
+                'total_ms': self.total_ms,
+                'mean_ms': self.total_ms / self.calls if self.calls else 0.0,
+                'max_ms': self.max_ms,
+                'rows': self.rows,
+                'slow': self.slow,
+                'histogram': dict(zip(labels, self.buckets)),
+                'call_sites': self.call_sites.most_common(TOP_CALL_SITES)}
+
+
+def enable_query_stats(slow_query_ms=None):
+    global _enabled, _slow_query_ms
+    if slow_query_ms is not None:
+        _slow_query_ms = float(slow_query_ms)
+    _enabled = True
+
+
+def disable_query_stats():
+    global _enabled
+    _enabled = False
+
+
+def query_stats_enabled():
+    return _enabled
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_query_stats():                               #Snapshot, helpers with the most total time first
+    with _stats_lock:
+        snapshot = {name: stats.as_dict() for name, stats in _stats.items()}
+    return dict(sorted(snapshot.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+
+def dump_query_stats(out=None):                      #Printable table of get_query_stats(), written to out if given
+    lines = [f"{'helper':<34}{'calls':>8}{'total ms':>11}{'mean ms':>9}{'max ms':>9}{'rows':>9}{'slow':>6}"]
+    for name, row in get_query_stats().items():
+        lines.append(f"{name:<34}{row['calls']:>8}{row['total_ms']:>11.1f}{row['mean_ms']:>9.2f}"
+                     f"{row['max_ms']:>9.2f}{row['rows']:>9}{row['slow']:>6}")
+        histogram = ', '.join(f"{label} {count}" for label, count in row['histogram'].items() if count)
+        lines.append(f"    histogram: {histogram}")
+        for call_site, count in row['call_sites']:
+            lines.append(f"    {count:>6} from {call_site}")
+    text = '\n'.join(lines)
+    if out is not None:
+        out.write(text + '\n')
+    return text
+
+
+def register_module(filename):                       #Frames from this file are skipped when finding the call site
+    _own_files.add(os.path.abspath(filename))
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame is not None and os.path.abspath(frame.f_code.co_filename) in _own_files:
+        frame = frame.f_back
+    if frame is None:
+        return '<unknown>'
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+def instrumented(get_connection=None, trigger_rows=None):
+    #For write helpers get_connection returns the writer, passed in rather than imported so database.py can
+    #decorate its own helpers. Read helpers leave it out, they are counted by the rows they return and never
+    #open a writer. trigger_rows(conn), if given, counts rows written by triggers so they are left out.
+    def decorator(func):
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            conn = get_connection() if get_connection else None
+            if conn is not None:
+                changes_before = conn.total_changes
+                triggered_before = trigger_rows(conn) if trigger_rows else 0
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            #Writes count the rows they changed, reads count the rows they returned
+            rows = 0
+            if conn is not None:
+                rows = conn.total_changes - changes_before
+                if rows and trigger_rows:
+                    rows -= trigger_rows(conn) - triggered_before
+            if not rows:
+                if isinstance(result, list):
+                    rows = len(result)
+                elif isinstance(result, tuple) and result and isinstance(result[0], list):     #(page, cursor)
+                    rows = len(result[0])
+                elif result is not None and result is not False:
+                    rows = 1
+            call_site = _call_site()
+            slow = elapsed_ms >= _slow_query_ms
+            if slow:
+                logger.warning("Slow query: %s took %.1f ms (%d rows) from %s", name, elapsed_ms, rows, call_site)
+            with _stats_lock:
+                stats = _stats.get(name)
+                if stats is None:
+                    stats = _stats[name] = HelperStats()
+                stats.record(elapsed_ms, rows, call_site, slow)
+            return result
+        return wrapper
+    return decorator
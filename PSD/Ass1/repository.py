@@ -0,0 +1,91 @@
+#Rental repository
+#Holds the loaded Rental objects with hash indexes by rental id, customer, car and status,
+#so lookups cost O(1) or O(matching rentals) instead of a scan over the whole history.
+#A lock keeps the indexes consistent when the system is used from several threads.
+
+
+import threading
+
+
+ACTIVE_STATUSES = ('pending', 'approved')
+
+
+class RentalRepository:
+
+    def __init__(self):
+        self._by_id = {}                             #rental_id -> Rental, kept in insertion order
+        self._by_customer = {}                       #username -> {rental_id: Rental}
+        self._by_car = {}                            #car_id -> {rental_id: Rental}
+        self._by_status = {}                         #status -> {rental_id: Rental}
+        self._loaded_scopes = set()                  #Slices fully read from the database, e.g. ('customer', 'test')
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, rental_id):
+        return rental_id in self._by_id
+
+    def add(self, rental):
+        rental_id = rental.get_rental_id()
+        with self._lock:
+            self._by_id[rental_id] = rental
+            self._by_customer.setdefault(rental.get_customer(), {})[rental_id] = rental
+            self._by_car.setdefault(rental.get_car_id(), {})[rental_id] = rental
+            self._by_status.setdefault(rental.get_status().lower(), {})[rental_id] = rental
+
+    def add_if_absent(self, rental):                 #Returns the rental already held under that id, if any
+        with self._lock:
+            existing = self._by_id.get(rental.get_rental_id())
+            if existing is not None:
+                return existing
+            self.add(rental)
+            return rental
+
+    def is_loaded(self, scope):
+        return scope in self._loaded_scopes
+
+    def mark_loaded(self, scope):
+        self._loaded_scopes.add(scope)
+
+    def get(self, rental_id):
+        return self._by_id.get(rental_id)
+
+    def all(self):
+        with self._lock:
+            return list(self._by_id.values())
+
+    def by_customer(self, username):
+        with self._lock:
+            return list(self._by_customer.get(username, {}).values())
+
+    def by_car(self, car_id):
+        with self._lock:
+            return list(self._by_car.get(car_id, {}).values())
+
+    def by_status(self, status):
+        with self._lock:
+            return list(self._by_status.get(status.lower(), {}).values())
+
+    def has_active_rental(self, car_id):
+        return any(r.get_status() in ACTIVE_STATUSES for r in self.by_car(car_id))
+
+    #Status changes go through the repository so the status index stays in step with the model
+    def approve(self, rental):
+        self._change_status(rental, rental.approve)
+
+    def reject(self, rental):
+        self._change_status(rental, rental.reject)
+
+    def return_car(self, rental):
+        self._change_status(rental, rental.return_car)
+
+    def _change_status(self, rental, transition):
+        rental_id = rental.get_rental_id()
+        with self._lock:
+            old_status = rental.get_status().lower()
+            transition()
+            bucket = self._by_status.get(old_status)
+            if bucket is not None:
+                bucket.pop(rental_id, None)
+            self._by_status.setdefault(rental.get_status().lower(), {})[rental_id] = rental
@@ -0,0 +1,80 @@
+#Password hashing and the verified-credential cache used at login
+
+
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+
+
+PASSWORD_HASH_ITERATIONS = 200_000                   #PBKDF2 cost, raise it as hardware gets faster
+CREDENTIAL_CACHE_SIZE = 10_000
+
+
+#Stored format: pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>
+#Anything without that prefix is a legacy plain text password from older databases.
+class PasswordHasher:
+    ALGORITHM = 'pbkdf2_sha256'
+
+    def __init__(self, iterations=PASSWORD_HASH_ITERATIONS):
+        self._iterations = iterations
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._derive(password, salt, self._iterations)
+        return f"{self.ALGORITHM}${self._iterations}${salt.hex()}${digest.hex()}"
+
+    def verify(self, password, stored):
+        parts = stored.split('$')
+        if len(parts) != 4 or parts[0] != self.ALGORITHM:
+            return hmac.compare_digest(stored.encode(), password.encode())
+        iterations, salt, digest = int(parts[1]), bytes.fromhex(parts[2]), bytes.fromhex(parts[3])
+        return hmac.compare_digest(self._derive(password, salt, iterations), digest)
+
+    def needs_rehash(self, stored):                  #Plain text or hashed with a different cost
+        parts = stored.split('$')
+        return len(parts) != 4 or parts[0] != self.ALGORITHM or int(parts[1]) != self._iterations
+
+    @staticmethod
+    def _derive(password, salt, iterations):
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def verify_password(password, stored):
+    return PasswordHasher().verify(password, stored)
+
+
+#Remembers passwords that already passed the slow hash check, so repeat logins skip PBKDF2.
+#Only a keyed HMAC of the password is kept, under a key that lives and dies with this process.
+#An entry is only trusted while the stored hash it was checked against is unchanged.
+class CredentialCache:
+
+    def __init__(self, max_entries=CREDENTIAL_CACHE_SIZE):
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()                #username -> (stored hash, password fingerprint)
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    def check(self, username, stored, password):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != stored:
+                return False
+            self._entries.move_to_end(username)
+        return hmac.compare_digest(entry[1], self._fingerprint(password))
+
+    def remember(self, username, stored, password):
+        fingerprint = self._fingerprint(password)
+        with self._lock:
+            self._entries[username] = (stored, fingerprint)
+            self._entries.move_to_end(username)
+            if len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def _fingerprint(self, password):
+        return hmac.new(self._key, password.encode(), hashlib.sha256).digest()
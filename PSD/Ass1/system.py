@@ -1,6 +1,18 @@
 import database
-from datetime import date, timedelta
+import threading
+from datetime import date, datetime, timedelta
 from models import Admin, Customer, Car, Rental
+from repository import RentalRepository, ACTIVE_STATUSES
+from availability import AvailabilityCalendar, as_date
+from analytics import RentalAnalytics
+from pricing import PricingEngine
+from pending_queue import PendingRequestQueue
+from events import EventSubscriber
+from security import PasswordHasher, CredentialCache
+
+
+ARCHIVE_AFTER_DAYS = 365                             #Closed rentals older than this are moved to the archive table
+RENTAL_ID_BLOCK_SIZE = 1                             #Raise when several front-ends share one database
 
 
 class CarRentalSystem:
@@ -11,63 +23,106 @@ class CarRentalSystem:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(CarRentalSystem, cls).__new__(cls)
-            cls._instance._users = []
-            cls._instance._rentals = []
+            cls._instance._users = {}                #username -> User, filled on first lookup
+            cls._instance._hasher = PasswordHasher()
+            cls._instance._credentials = CredentialCache()
+            cls._instance._rentals = RentalRepository()
+            cls._instance._cars = {}                 #Fleet cache: car_id -> Car, kept in database order
+            cls._instance._fleet_loaded = False
+            cls._instance._rental_ids = database.IdBlockAllocator('rental', RENTAL_ID_BLOCK_SIZE)
+            cls._instance._calendar = None           #Built from the active rentals on first use
+            cls._instance._analytics = RentalAnalytics()
+            cls._instance._pricing = PricingEngine()
+            cls._instance._utilization = None        #Share of the fleet rented out now, None until next quote
+            cls._instance._pending = None            #PendingRequestQueue, built on first use
+            cls._instance._pending_events = None     #Its change event cursor
+            cls._instance._read_pool = None          #database.ReadWorkerPool for the fleet listings, off by default
+            cls._instance._lock = threading.RLock()  #Guards the lazy builds when used from several threads
             cls._instance._initialize_system()
         return cls._instance
 
+    #Startup only applies pending migrations and checks the default admin.
+    #Users and rentals are loaded lazily the first time they are asked for.
     def _initialize_system(self):
-        #Load users from database
-        user_rows = database.get_all_users_from_db()
-        for row in user_rows:
-            username, password, role = row
-            if role == 'admin':
-                self._users.append(Admin(username, password))
-            elif role == 'customer':
-                self._users.append(Customer(username, password))
-        
+        database.migrate()
+
         #Create default admin if no admin user exists
-        if not any(user.get_role() == 'admin' for user in self._users):
-            admin = Admin("admin", "password")
-            self._users.append(admin)
-            database.insert_user_into_db("admin", "password", "admin")
-        
-        #Load rental records from database
-        rental_rows = database.get_all_rentals_from_db()
-        max_rental_id = 0
-        for row in rental_rows:
-            rental_id, customer_username, car_id, start_date, end_date, total_cost, additional_fees, status, return_date = row
-            rental = Rental(customer_username, car_id, start_date, end_date, total_cost, additional_fees, rental_id)
-            rental._status = status
-            rental._return_date = return_date
-            self._rentals.append(rental)
-            
-            #Extract numeric part of rental ID to update _next_id
-            if rental_id.startswith('R-'):
-                try:
-                    id_num = int(rental_id[2:])
-                    max_rental_id = max(max_rental_id, id_num)
-                except ValueError:
-                    pass
-        
-        #Update Rental._next_id to avoid conflicts
-        if max_rental_id > 0:
-            Rental._next_id = max_rental_id + 1
+        if not database.admin_exists_in_db():
+            password_hash = self._hasher.hash("password")
+            admin = Admin("admin", password_hash)
+            self._users[admin.get_username()] = admin
+            database.insert_user_into_db("admin", password_hash, "admin")
+
+    #Forget everything cached in memory, the next lookups reload from the database.
+    #Used when a transaction the caches were updated under is rolled back.
+    def discard_caches(self):
+        with self._lock:
+            self._users = {}
+            self._credentials = CredentialCache()
+            self._rentals = RentalRepository()
+            self._cars = {}
+            self._fleet_loaded = False
+            self._calendar = None
+            self._analytics = RentalAnalytics()
+            self._pricing = PricingEngine()
+            self._utilization = None
+            self._pending = None
+            self._pending_events = None
 
     #Management of customer info
+    def _find_user(self, username):
+        user = self._users.get(username)
+        if user is None:
+            row = database.get_user_from_db(username)
+            if row:
+                user = self._user_from_row(row)
+                self._users[username] = user
+        return user
+
+    @staticmethod
+    def _user_from_row(row):
+        username, password, role = row
+        if role == 'admin':
+            return Admin(username, password)
+        elif role == 'customer':
+            return Customer(username, password)
+        return None
+
     def register_customer(self, username, password):
-        if any(user.get_username() == username for user in self._users):
+        if self._find_user(username):
+            return False, "Username already exists."
+        return self.register_customer_with_hash(username, self.hash_password(password))
+
+    def hash_password(self, password):               #Slow on purpose, keep it outside transactions
+        return self._hasher.hash(password)
+
+    #For callers that hash up front, e.g. batch mode, so no write lock is held during PBKDF2
+    def register_customer_with_hash(self, username, password_hash):
+        if self._find_user(username):
+            return False, "Username already exists."
+        #The check above is only a fast path, the insert decides when two sessions race for the name
+        if not database.insert_user_into_db(username, password_hash, "customer"):
             return False, "Username already exists."
-        new_customer = Customer(username, password)
-        self._users.append(new_customer)
-        database.insert_user_into_db(username, password, "customer")
+        self._users[username] = Customer(username, password_hash)
         return True, "Customer registration successful."
 
+    #Users are looked up by primary key; repeat logins are answered from the credential cache.
+    #Plain text or outdated hashes are upgraded the first time the right password is given.
     def authenticate_user(self, username, password):
-        for user in self._users:
-            if user.get_username() == username and user.check_password(password):
-                return user
-        return None
+        user = self._find_user(username)
+        if not user:
+            return None
+        stored = user.get_password_hash()
+        if self._credentials.check(username, stored, password):
+            return user
+        if not self._hasher.verify(password, stored):
+            return None
+        if self._hasher.needs_rehash(stored):
+            stored = self._hasher.hash(password)
+            database.update_user_password_in_db(username, stored)
+            user.set_password_hash(stored)
+        self._credentials.remember(username, stored, password)
+        return user
     
     #Admin management of cars
     def add_car(self, car_data):
@@ -78,101 +133,211 @@ class CarRentalSystem:
         if min_rent_days > max_rent_days:
             return False, "Minimum rental days cannot be greater than maximum rental days."
 
-        if database.get_car_by_id_from_db(car_id):
+        if self.find_car_by_id(car_id):
             return False, "Car ID already exists."
 
         database.insert_car_into_db(car_data)
+        self._refresh_car(car_id)
         return True, "Car added successfully."
 
+    #Read-through fleet cache, the database is only hit on a miss
     def find_car_by_id(self, car_id):
+        car = self._cars.get(car_id)
+        if car or self._fleet_loaded:
+            return car
+        return self._refresh_car(car_id)
+
+    def _refresh_car(self, car_id):                  #Reload one car after a write so the cache matches the database
         car_data = database.get_car_by_id_from_db(car_id)
-        if car_data:
-            return Car(
-                car_id=car_data[0],
-                make=car_data[1],
-                model=car_data[2],
-                year=car_data[3],
-                mileage=car_data[4],
-                available_now=car_data[5],
-                min_rent_days=car_data[6],
-                max_rent_days=car_data[7],
-                daily_rate=car_data[8],
-                fuel_type=car_data[9]
-            )
-        return None
+        if not car_data:
+            self._cars.pop(car_id, None)
+            return None
+        car = Car.from_row(car_data)
+        self._cars[car_id] = car
+        self._utilization = None
+        return car
+
+    def _set_cached_availability(self, car_id, status, version):
+        car = self._cars.get(car_id)
+        if car and version is not None:
+            car.set_availability(status)
+            car.set_version(version)
+        self._utilization = None
+
 
     def update_car(self, car_id, new_mileage, new_daily_rate):
         car = self.find_car_by_id(car_id)
         if not car:
             return False, "Car ID not found."
 
-        new_data = {
-            'make': car.get_make(),
-            'model': car.get_model(),
-            'year': car.get_year(),
-            'mileage': new_mileage,
-            'available_now': car.is_available(),
-            'min_rent_days': car.get_min_rent_days(),
-            'max_rent_days': car.get_max_rent_days(),
-            'daily_rate': new_daily_rate,
-            'fuel_type': car.get_fuel_type()
-        }
-        database.update_car_in_db(car_id, new_data)
+        database.update_car_rate_and_mileage_in_db(car_id, new_mileage, new_daily_rate)
+        self._refresh_car(car_id)
         return True, "Car information updated successfully."
 
     def remove_car(self, car_id):
         car = self.find_car_by_id(car_id)
         if not car:
             return False, "Car ID not found."
-        if any(r.get_car_id() == car_id and r.get_status() in ['pending', 'approved'] for r in self._rentals):
+        self._load_rentals(('car', car_id), database.get_rentals_by_car_from_db, car_id)
+        if self._rentals.has_active_rental(car_id):
             return False, "Cannot delete, this car has active rental records."
         database.delete_car_from_db(car_id)
+        self._cars.pop(car_id, None)
+        self._pricing.invalidate(car_id)
+        self._utilization = None
         return True, "Car deleted successfully."
 
+    #Fleet listings read through pool, a database.ReadWorkerPool, from then on; None reads in-process again.
+    #The caller owns the pool and closes it.
+    def use_read_pool(self, pool):
+        self._read_pool = pool
+
+    def _read(self, helper, *args):
+        pool = self._read_pool
+        if pool is None or database.in_transaction():    #A worker cannot see this thread's uncommitted writes
+            return helper(*args)
+        return pool.call(helper, *args)
+
     def get_all_cars(self):
-        car_rows = database.get_all_cars_from_db()
-        return [Car(
-            car_id=row[0], make=row[1], model=row[2], year=row[3],
-            mileage=row[4], available_now=row[5], min_rent_days=row[6],
-            max_rent_days=row[7], daily_rate=row[8], fuel_type=row[9]
-        ) for row in car_rows]
+        if not self._fleet_loaded:
+            with self._lock:
+                if not self._fleet_loaded:
+                    self._cars = {row[0]: Car.from_row(row) for row in self._read(database.get_all_cars_from_db)}
+                    self._fleet_loaded = True
+        return list(self._cars.values())
 
 
     #Customer management of bookings
     def get_available_cars(self):
-        all_cars = self.get_all_cars()
-        return [car for car in all_cars if car.is_available()]
+        return self._free_today([car for car in self.get_all_cars() if car.is_available()])
+
+    #A future booking never takes available_now, not even once its start date arrives, so cars booked
+    #over today are dropped from the available listings here.
+    def _free_today(self, cars):
+        calendar = self._booking_calendar()
+        today = date.today()
+        tomorrow = today + timedelta(days=1)
+        return [car for car in cars if calendar.is_free(car.get_car_id(), today, tomorrow)]
+
+    #Filtered listing done in SQL, returns (cars, next_cursor); next_cursor is None on the last page.
+    #A page can come back short when some of its cars are booked over today.
+    def search_available_cars(self, fuel_type=None, make=None, min_rate=None, max_rate=None,
+                              rent_days=None, page_size=50, cursor=None):
+        rows = self._read(database.search_available_cars_in_db, fuel_type, make, min_rate, max_rate,
+                          rent_days, cursor, page_size)
+        cars = []
+        for row in rows:
+            car = Car.from_row(row)
+            cached = self._cars.get(row[0])
+            if cached is not None and cached.get_version() == car.get_version():
+                car = cached                         #Still current, keep the one object per car
+            else:
+                self._cars[row[0]] = car             #New to us, or changed by another front-end
+            cars.append(car)
+        next_cursor = rows[-1][0] if len(rows) == page_size else None
+        return self._free_today(cars), next_cursor
+
+    #Cars with no booking overlapping [start_date, end_date); the range must not start in the past
+    def get_cars_free_between(self, start_date, end_date):
+        start_date, end_date = as_date(start_date), as_date(end_date)
+        calendar = self._booking_calendar()
+        starts_now = start_date <= date.today()
+        return [car for car in self.get_all_cars()
+                if (car.is_available() or not starts_now)
+                and calendar.is_free(car.get_car_id(), start_date, end_date)]
+
+    def _booking_calendar(self):
+        if self._calendar is None:
+            with self._lock:
+                if self._calendar is None:
+                    calendar = AvailabilityCalendar()
+                    for status in ACTIVE_STATUSES:
+                        for rental in self.get_rentals_by_status(status):
+                            calendar.book(rental.get_car_id(), rental.get_start_date(), rental.get_end_date(),
+                                          rental.get_rental_id())
+                    self._calendar = calendar
+        return self._calendar
+
+    def _fleet_utilization(self):                    #Recounted only after this process changes a car's availability
+        utilization = self._utilization
+        if utilization is None:
+            fleet, rented = database.count_rented_cars_in_db()
+            utilization = self._utilization = rented / fleet if fleet else 0.0
+        return utilization
 
-    def book_car(self, customer_username, car_id, rent_days, additional_fees):
+    #Price of renting a car, see pricing.py. Returns (quote, message), quote is None if the request is invalid.
+    def quote_rental(self, car_id, rent_days, start_date=None, additional_fees=0.0):
+        start_date = as_date(start_date) if start_date else date.today()
         car = self.find_car_by_id(car_id)
         if not car:
             return None, "Invalid car ID."
-        if not car.is_available():
-            return None, "Sorry, this car is currently unavailable."
+        if not (car.get_min_rent_days() <= rent_days <= car.get_max_rent_days()):
+            return None, f"Rental days must be between {car.get_min_rent_days()} and {car.get_max_rent_days()} days."
+        quote = self._pricing.quote(car, start_date, rent_days, additional_fees, self._fleet_utilization())
+        return quote, f"Total rental cost is ${quote['total_cost']:.2f}."
+
+    #start_date defaults to today. Only bookings starting today take the car's available_now flag,
+    #future bookings are held in the calendar.
+    def book_car(self, customer_username, car_id, rent_days, additional_fees, start_date=None):
+        today = date.today()
+        start_date = as_date(start_date) if start_date else today
+        car = self.find_car_by_id(car_id)
+        if not car:
+            return None, "Invalid car ID."
+        if start_date < today:
+            return None, "Rental start date cannot be in the past."
+        starts_now = start_date == today
+        if starts_now and not car.is_available():
+            car = self._refresh_car(car_id)          #Our copy may be stale, another front-end may have freed it
+            if not car or not car.is_available():
+                return None, "Sorry, this car is currently unavailable."
         if not (car.get_min_rent_days() <= rent_days <= car.get_max_rent_days()):
             return None, f"Rental days must be between {car.get_min_rent_days()} and {car.get_max_rent_days()} days."
 
-        start_date = date.today()
         end_date = start_date + timedelta(days=rent_days)
-        total_cost = rent_days * car.get_daily_rate() + additional_fees
-
-        new_rental = Rental(customer_username, car_id, start_date, end_date, total_cost, additional_fees)
-        self._rentals.append(new_rental)
-        
-        #Save rental to database
-        rental_data = {
-            'rental_id': new_rental.get_rental_id(),
-            'customer_username': customer_username,
-            'car_id': car_id,
-            'start_date': str(start_date),
-            'end_date': str(end_date),
-            'total_cost': total_cost,
-            'additional_fees': additional_fees,
-            'status': 'pending',
-            'return_date': None
-        }
-        database.insert_rental_into_db(rental_data)
-        database.update_car_availability_in_db(car_id, False) 
+        calendar = self._booking_calendar()
+        if not calendar.is_free(car_id, start_date, end_date):
+            return None, "Sorry, this car is already booked for those dates."
+        booked_message = "Sorry, this car was just booked by someone else."
+        total_cost = self._pricing.quote(car, start_date, rent_days, additional_fees,
+                                         self._fleet_utilization())['total_cost']
+
+        #Take the car, allocate the rental id and save the rental in one transaction.
+        #Other processes have no view of this calendar, so the conflict checks are made against the database.
+        version = None
+        with database.transaction():
+            if database.rental_overlaps_in_db(car_id, start_date, end_date):
+                return None, booked_message
+            if starts_now:
+                version = database.reserve_car_in_db(car_id, car.get_version())
+                if version is None:
+                    car = self._refresh_car(car_id)  #Our copy was stale, retry once against the current row
+                    if car and car.is_available():
+                        version = database.reserve_car_in_db(car_id, car.get_version())
+                    if version is None:
+                        return None, booked_message
+            rental_id = f"R-{self._rental_ids.next_id():03d}"
+            submitted_at = datetime.now().isoformat(timespec='seconds')
+            new_rental = Rental(customer_username, car_id, start_date, end_date, total_cost, additional_fees, rental_id)
+            rental_data = {
+                'rental_id': rental_id,
+                'customer_username': customer_username,
+                'car_id': car_id,
+                'start_date': str(start_date),
+                'end_date': str(end_date),
+                'total_cost': total_cost,
+                'additional_fees': additional_fees,
+                'status': 'pending',
+                'return_date': None,
+                'submitted_at': submitted_at
+            }
+            database.insert_rental_into_db(rental_data)
+        if starts_now:
+            self._set_cached_availability(car_id, False, version)
+        self._rentals.add(new_rental)
+        calendar.book(car_id, start_date, end_date, new_rental.get_rental_id())
+        if self._pending is not None:
+            self._pending.add(new_rental, submitted_at)
         return new_rental, "Car booking successful! Your application has been submitted, please wait for admin approval."
 
     def return_car(self, rental_id):
@@ -186,45 +351,171 @@ class CarRentalSystem:
         if not car:
             return False, "Car associated with this rental record not found.", 0
 
-        rental.return_car()
-        database.update_rental_status_in_db(rental_id, 'returned', str(rental._return_date))
-        database.update_car_availability_in_db(car.get_car_id(), True)  #After customer return the car it becomes available again
+        today = date.today()
+        with database.transaction():
+            database.update_rental_status_in_db(rental_id, 'returned', str(today))
+            #A booking that has not started yet never took the car, and another that has may hold it now
+            released = (database.release_cars_in_db([car.get_car_id()], today)
+                        if as_date(rental.get_start_date()) <= today else {})
+        if car.get_car_id() in released:
+            self._set_cached_availability(car.get_car_id(), True, released[car.get_car_id()])
+        self._rentals.return_car(rental)
+        self._booking_calendar().release(rental_id)
         return True, "Car returned successfully!", rental.get_total_cost()
 
     
     #Admin management of rental records
     def get_customer_rentals(self, username):
-        return [r for r in self._rentals if r.get_customer() == username]
+        self._load_rentals(('customer', username), database.get_rentals_by_customer_from_db, username)
+        return self._rentals.by_customer(username)
 
     def get_all_rentals(self):
-        return self._rentals
+        return [rental for page in self.iter_rental_pages() for rental in page]
+
+    #Yields rental records page by page in database order, only the requested pages are loaded
+    def iter_rental_pages(self, page_size=500):
+        after_rowid = 0
+        while True:
+            rows, after_rowid = database.get_rentals_page_from_db(after_rowid, page_size)
+            if not rows:
+                return
+            yield [self._load_rental(row) for row in rows]
 
     def get_rentals_by_status(self, status):
-        return [r for r in self._rentals if r.get_status().lower() == status.lower()]
+        status = status.lower()
+        self._load_rentals(('status', status), database.get_rentals_by_status_from_db, status)
+        return self._rentals.by_status(status)
 
     def find_rental_by_id(self, rental_id):
-        for rental in self._rentals:
-            if rental.get_rental_id() == rental_id:
-                return rental
-        return None
+        rental = self._rentals.get(rental_id)
+        if rental is None:
+            row = database.get_rental_by_id_from_db(rental_id)
+            if row:
+                rental = self._load_rental(row)
+        return rental
+
+    #Rentals already in memory are kept as they are, the repository is the identity map
+    def _load_rental(self, row):
+        rental = self._rentals.get(row[0])
+        if rental is None:
+            rental = self._rentals.add_if_absent(Rental.from_row(row))
+        return rental
+
+    #Loads one slice of the rental history (a customer, a status, a car) the first time it is needed.
+    #Later writes go through the repository, so the slice stays complete after that.
+    def _load_rentals(self, scope, query, key):
+        if self._rentals.is_loaded(scope):
+            return
+        for row in query(key):
+            self._load_rental(row)
+        self._rentals.mark_loaded(scope)
+
+    #Pending requests, oldest submission first, see pending_queue.py
+    def _pending_requests(self):
+        if self._pending is None:
+            with self._lock:
+                if self._pending is None:
+                    #Position the event cursor first, so nothing between it and the load is missed
+                    events = EventSubscriber(entities=['rental'], from_start=False)
+                    queue = PendingRequestQueue()
+                    for row in database.get_rentals_by_status_from_db('pending'):
+                        queue.add(self._load_rental(row), row[9])
+                    self._pending_events = events
+                    self._pending = queue
+        return self._pending
+
+    def _sync_pending_requests(self):                #Applies requests booked or decided by other processes
+        with self._lock:
+            queue, events = self._pending_requests(), self._pending_events
+            while True:                              #One batch at a time until the log is caught up
+                changes = events.read()
+                if not changes:
+                    break
+                for event in changes:
+                    if event.action == 'delete' or event.data['status'] != 'pending':
+                        queue.discard(event.entity_id)
+                    elif event.action == 'insert':
+                        rental = self.find_rental_by_id(event.entity_id)
+                        if rental:
+                            queue.add(rental, event.created_at)
+                events.commit(changes[-1].event_id)
+        return queue
+
+    def pending_request_count(self):
+        return len(self._sync_pending_requests())
+
+    def get_pending_requests(self, limit=None):
+        return self._sync_pending_requests().oldest(limit)
+
+    #Blocks until a request is waiting and returns the oldest, None after timeout seconds
+    def wait_for_pending_request(self, timeout=None):
+        return self._sync_pending_requests().wait_for_next(timeout, refresh=self._sync_pending_requests)
+
+    #Moves returned and rejected rentals closed more than older_than_days ago into rentals_archive.
+    #They stay visible to get_customer_rentals, find_rental_by_id and get_rentals_by_status.
+    def archive_closed_rentals(self, older_than_days=ARCHIVE_AFTER_DAYS):
+        return database.archive_closed_rentals_in_db(date.today() - timedelta(days=older_than_days))
+
+    #Revenue, utilization and approval latency, see analytics.py
+    def get_rental_analytics(self):
+        return self._analytics.report()
 
     def manage_rental_request(self, rental_id, action):
-        rental = self.find_rental_by_id(rental_id)
-        if not rental:
-            return False, "Rental ID not found."
-        if rental.get_status() != 'pending':
-            return False, "This rental request has already been processed, cannot repeat operation."
+        return self.manage_rental_requests([rental_id], action)[rental_id]
 
-        car = self.find_car_by_id(rental.get_car_id())
+    #Approves or rejects a set of requests with one executemany per table and a single commit.
+    #Returns {rental_id: (success, message)} in the order the ids were given.
+    def manage_rental_requests(self, rental_ids, action):
+        rental_ids = list(dict.fromkeys(rental_ids))
+        self.get_rentals_by_status('pending')        #One query brings every pending request into memory
+        results = {}
+        candidates = []
+        for rental_id in rental_ids:
+            rental = self.find_rental_by_id(rental_id)
+            if not rental:
+                results[rental_id] = (False, "Rental ID not found.")
+            elif rental.get_status() != 'pending':
+                results[rental_id] = (False, "This rental request has already been processed, cannot repeat operation.")
+            elif action not in ('approve', 'reject'):
+                results[rental_id] = (False, "Invalid operation.")
+            else:
+                candidates.append(rental)
+
+        freed_cars = {}
+        if candidates:
+            with database.transaction():
+                #Re-check under the write lock, another admin or process may have got there first
+                still_pending = database.get_pending_rental_ids_in_db([r.get_rental_id() for r in candidates])
+                decided = [r for r in candidates if r.get_rental_id() in still_pending]
+                decided_at = datetime.now().isoformat(timespec='seconds')
+                if action == 'approve':
+                    database.update_rental_statuses_in_db([r.get_rental_id() for r in decided], 'approved',
+                                                          decided_at=decided_at)
+                else:
+                    #A future booking never took the car's flag; one that has started may, unless another holds it
+                    today = date.today()
+                    started = list(dict.fromkeys(r.get_car_id() for r in decided
+                                                 if as_date(r.get_start_date()) <= today))
+                    database.update_rental_statuses_in_db([r.get_rental_id() for r in decided], 'rejected',
+                                                          decided_at=decided_at)
+                    freed_cars = database.release_cars_in_db(started, today)
+
+            for rental in candidates:
+                rental_id = rental.get_rental_id()
+                if rental_id not in still_pending:
+                    results[rental_id] = (False, "This rental request has already been processed, cannot repeat operation.")
+                elif action == 'approve':
+                    self._rentals.approve(rental)
+                    if self._pending is not None:
+                        self._pending.discard(rental_id)
+                    results[rental_id] = (True, f"Rental {rental_id} has been approved.")
+                else:
+                    self._rentals.reject(rental)
+                    if self._pending is not None:
+                        self._pending.discard(rental_id)
+                    self._booking_calendar().release(rental_id)
+                    results[rental_id] = (True, f"Rental {rental_id} has been rejected.")
+            for car_id, version in freed_cars.items():
+                self._set_cached_availability(car_id, True, version)
 
-        if action == 'approve':
-            rental.approve()
-            database.update_rental_status_in_db(rental_id, 'approved')
-            return True, f"Rental {rental_id} has been approved."
-        elif action == 'reject':
-            rental.reject()
-            database.update_rental_status_in_db(rental_id, 'rejected')
-            if car:
-                database.update_car_availability_in_db(car.get_car_id(), True)  #If a booking is rejected, the car becomes available again
-            return True, f"Rental {rental_id} has been rejected."
-        return False, "Invalid operation."
\ No newline at end of file
+        return {rental_id: results[rental_id] for rental_id in rental_ids}
@@ -0,0 +1,52 @@
+#Every test runs against its own car_rental.db in a temporary directory, never the committed one
+import os
+import shutil
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import database
+from system import CarRentalSystem
+
+
+COMMITTED_DB = os.path.join(PROJECT_DIR, 'car_rental.db')
+SEED_CSV = os.path.join(PROJECT_DIR, 'seed_cars.csv')
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    database.close_connections()
+    path = str(tmp_path / 'car_rental.db')
+    monkeypatch.setattr(database, 'DB_NAME', path)
+    monkeypatch.setattr(CarRentalSystem, '_instance', None)
+    yield path
+    database.close_connections()
+
+
+@pytest.fixture
+def fresh_db(db_path):                               #Database holding the ten seed cars
+    database.create_tables()
+    database.import_cars_from_csv(SEED_CSV)
+    return db_path
+
+
+@pytest.fixture
+def committed_db(db_path):                           #Copy of the database shipped with the project
+    shutil.copy(COMMITTED_DB, db_path)
+    return db_path
+
+
+@pytest.fixture
+def system(fresh_db):
+    system = CarRentalSystem()
+    system.register_customer('amy', 'secret')
+    return system
+
+
+def insert_rental(rental_id, car_id='Car-001', status='pending', start_date='2026-01-01', end_date='2026-01-04'):
+    database.insert_rental_into_db({'rental_id': rental_id, 'customer_username': 'amy', 'car_id': car_id,
+                                    'start_date': start_date, 'end_date': end_date, 'total_cost': 100.0,
+                                    'additional_fees': 0.0, 'status': status, 'return_date': None})
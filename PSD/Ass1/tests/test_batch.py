@@ -0,0 +1,84 @@
+import io
+import json
+from contextlib import contextmanager
+
+import batch
+import database
+
+
+def run(system, operations, group_size=batch.BATCH_GROUP_SIZE):
+    lines = [op if isinstance(op, str) else json.dumps(op) for op in operations]
+    out = io.StringIO()
+    total, failures = batch.run_batch(system, lines, out, group_size)
+    return total, failures, [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_failing_operations_do_not_undo_the_rest_of_the_group(system):
+    total, failures, results = run(system, [
+        {'op': 'register', 'username': 'bob', 'password': 'pw'},
+        {'op': 'register', 'username': 'carl', 'password': None},
+        {'op': 'register', 'username': 'dan'},
+        'not json',
+        {'op': 'fly'},
+        {'op': 'book', 'username': 'bob', 'car_id': 'Car-001', 'rent_days': 'three'},
+        {'op': 'book', 'username': 'bob', 'car_id': 'Car-001', 'rent_days': 3, 'id': 'first'},
+        {'op': 'approve', 'rental_ids': ['R-404']},
+    ])
+    assert (total, failures) == (8, 6)
+    assert [result['ok'] for result in results] == [True, False, False, False, False, False, True, False]
+    assert results[1]['message'] == 'Invalid value: password must be a string'
+    assert results[2]['message'] == 'Missing field: password'
+    assert results[3]['message'].startswith('Invalid JSON')
+    assert results[6]['id'] == 'first'
+
+    assert database.get_user_from_db('bob') is not None
+    assert database.get_user_from_db('carl') is None
+    assert database.get_rental_by_id_from_db(results[6]['rental_id']) is not None
+    assert not system.find_car_by_id('Car-001').is_available()
+
+
+def test_single_rental_id_string_is_one_id(system):
+    rental, _ = system.book_car('amy', 'Car-001', 2, 0)
+    _, _, results = run(system, [{'op': 'approve', 'rental_ids': rental.get_rental_id()}])
+    assert results[0]['ok'] and list(results[0]['results']) == [rental.get_rental_id()]
+
+
+def test_passwords_are_hashed_before_the_group_takes_the_write_lock(system, monkeypatch):
+    hash_password = system.hash_password
+    in_transaction = []
+
+    def watched(password):
+        in_transaction.append(database.get_connection().in_transaction)
+        return hash_password(password)
+
+    monkeypatch.setattr(system, 'hash_password', watched)
+    _, failures, _ = run(system, [{'op': 'register', 'username': f'user{i}', 'password': 'pw'} for i in range(3)])
+    assert failures == 0 and in_transaction == [False, False, False]
+
+
+def test_a_rolled_back_group_reports_every_operation(system, monkeypatch):
+    real_transaction = database.transaction
+    depth = []
+
+    @contextmanager
+    def failing_commit():                            #The group's own block fails after every operation ran
+        depth.append(None)
+        try:
+            with real_transaction():
+                yield
+                if len(depth) == 1:
+                    raise RuntimeError('commit failed')
+        finally:
+            depth.pop()
+
+    monkeypatch.setattr(database, 'transaction', failing_commit)
+    total, failures, results = run(system, [
+        {'op': 'register', 'username': 'bob', 'password': 'pw'},
+        {'op': 'book', 'username': 'amy', 'car_id': 'Car-001', 'rent_days': 2},
+        {'op': 'register', 'username': 'carl', 'password': None},
+    ])
+    assert (total, failures) == (3, 3)
+    assert [result['message'] for result in results] == ['Batch group rolled back: commit failed'] * 2 + [
+        'Invalid value: password must be a string']
+    assert database.get_user_from_db('bob') is None
+    assert system.find_car_by_id('Car-001').is_available()   #The caches were dropped with the group
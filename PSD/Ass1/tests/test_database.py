@@ -0,0 +1,191 @@
+import os
+import sqlite3
+import threading
+
+import pytest
+
+import database
+import query_stats
+from conftest import SEED_CSV
+from system import CarRentalSystem
+
+
+def available_now(car_id):
+    return database.get_connection().execute(
+        'SELECT available_now FROM cars WHERE car_id = ?', (car_id,)).fetchone()[0]
+
+
+#Transactions
+def test_transaction_commits_on_success(fresh_db):
+    with database.transaction():
+        database.update_car_availability_in_db('Car-001', False)
+        database.update_car_availability_in_db('Car-002', False)
+    assert available_now('Car-001') == 0 and available_now('Car-002') == 0
+
+
+def test_transaction_rolls_back_every_write_on_error(fresh_db):
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.update_car_availability_in_db('Car-001', False)
+            database.update_car_availability_in_db('Car-002', False)
+            raise RuntimeError('boom')
+    assert available_now('Car-001') == 1 and available_now('Car-002') == 1
+    assert not database.get_connection().in_transaction
+
+
+def test_nested_transaction_is_a_savepoint(fresh_db):
+    with database.transaction():
+        database.update_car_availability_in_db('Car-001', False)
+        with pytest.raises(KeyError):
+            with database.transaction():
+                database.update_car_availability_in_db('Car-002', False)
+                raise KeyError('inner')
+    assert available_now('Car-001') == 0               #The outer block still commits
+    assert available_now('Car-002') == 1               #Only the savepoint was undone
+
+
+
+def test_rollback_hooks_run_only_for_the_failed_block(fresh_db):
+    calls = []
+    with database.transaction():
+        database.on_rollback(lambda: calls.append('outer'))
+        with pytest.raises(ValueError):
+            with database.transaction():
+                database.on_rollback(lambda: calls.append('inner'))
+                raise ValueError
+    assert calls == ['inner']
+
+
+
+def test_closing_leaves_a_self_contained_database_file(fresh_db):
+    database.update_car_availability_in_db('Car-001', False)
+    assert database.get_car_by_id_from_db('Car-001')[5] == 0       #Opens the read-only connection too
+    database.close_connections()
+    assert not os.path.exists(fresh_db + '-wal')
+    with sqlite3.connect(fresh_db) as conn:
+        assert conn.execute("SELECT available_now FROM cars WHERE car_id = 'Car-001'").fetchone() == (0,)
+
+#Migrations
+def test_migrates_the_committed_database(committed_db):
+    conn = database.get_connection()
+    cars_before = conn.execute('SELECT car_id, make, available_now FROM cars ORDER BY car_id').fetchall()
+    rentals_before = conn.execute('SELECT rental_id, status FROM rentals ORDER BY rental_id').fetchall()
+
+    version_before = database.get_schema_version()
+    assert database.migrate() == len(database.MIGRATIONS) - version_before
+    assert database.get_schema_version() == len(database.MIGRATIONS)
+    assert database.migrate() == 0                    #Already current, nothing to do
+
+    assert conn.execute('SELECT car_id, make, available_now FROM cars ORDER BY car_id').fetchall() == cars_before
+    assert conn.execute('SELECT rental_id, status FROM rentals ORDER BY rental_id').fetchall() == rentals_before
+    assert 'version' in [row[1] for row in conn.execute('PRAGMA table_info(cars)')]
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert 'sequences' in tables
+
+
+def test_committed_database_is_usable_after_migration(committed_db):
+    system = CarRentalSystem()
+    system.register_customer('amy', 'secret')
+    car = system.get_available_cars()[0]
+    rental, message = system.book_car('amy', car.get_car_id(), 2, 0)
+    assert rental, message
+    assert system.find_rental_by_id(rental.get_rental_id()) is not None
+
+#CSV import
+def car_make(car_id):
+    row = database.get_connection().execute('SELECT make FROM cars WHERE car_id = ?', (car_id,)).fetchone()
+    return row[0] if row else None
+
+
+def test_import_in_chunks_with_worker_processes(db_path):
+    database.create_tables()
+    report = database.import_cars_from_csv(SEED_CSV, chunk_size=3, workers=2)
+    assert report['read'] == 10 and report['rejected'] == []
+    assert database.get_connection().execute('SELECT COUNT(*) FROM cars').fetchone()[0] == 10
+
+
+def test_import_reports_rejected_rows(db_path, tmp_path):
+    database.create_tables()
+    with open(SEED_CSV, encoding='utf-8') as file:
+        header, first, second = file.read().splitlines()[:3]
+    csv_path = tmp_path / 'cars.csv'
+    csv_path.write_text('\n'.join([header, first, second.replace('2024', 'new')]) + '\n', encoding='utf-8')
+    report = database.import_cars_from_csv(str(csv_path))
+    assert report['read'] == 2
+    assert [line for line, _ in report['rejected']] == [3]
+    assert car_make('Car-001') == 'Toyota' and car_make('Car-002') is None
+
+
+def test_import_conflict_modes(fresh_db):
+    database.get_connection().execute("UPDATE cars SET make = 'Renamed' WHERE car_id = 'Car-001'")
+    database.get_connection().commit()
+    database.import_cars_from_csv(SEED_CSV)                       #skip keeps the existing car
+    assert car_make('Car-001') == 'Renamed'
+    with pytest.raises(sqlite3.IntegrityError):
+        database.import_cars_from_csv(SEED_CSV, on_conflict='fail')
+    database.import_cars_from_csv(SEED_CSV, on_conflict='upsert')
+    assert car_make('Car-001') == 'Toyota'
+
+
+#Rental ids
+def test_id_allocators_never_hand_out_the_same_id(system):
+    first, second = database.IdBlockAllocator('rental', 5), database.IdBlockAllocator('rental', 5)
+    ids = [allocator.next_id() for _ in range(7) for allocator in (first, second)]
+    assert len(set(ids)) == len(ids)
+
+
+def test_rolled_back_id_block_is_given_out_again(system):
+    allocator = database.IdBlockAllocator('rental', 3)
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            taken = allocator.next_id()
+            raise RuntimeError
+    assert allocator.next_id() == taken
+
+
+#Change event triggers write rows too, they must not show up in the counts
+def test_import_report_counts_cars_not_trigger_rows(db_path):
+    database.create_tables()
+    report = database.import_cars_from_csv(SEED_CSV)
+    assert (report['read'], report['written'], report['skipped'], report['rejected']) == (10, 10, 0, [])
+    report = database.import_cars_from_csv(SEED_CSV)
+    assert (report['read'], report['written'], report['skipped']) == (10, 0, 10)
+    report = database.import_cars_from_csv(SEED_CSV, on_conflict='upsert')
+    assert (report['read'], report['written'], report['skipped']) == (10, 10, 0)
+
+
+def test_query_stats_count_only_the_helpers_own_rows(fresh_db):
+    query_stats.reset_query_stats()
+    query_stats.enable_query_stats()
+    try:
+        database.update_car_availability_in_db('Car-001', False)
+    finally:
+        query_stats.disable_query_stats()
+    assert query_stats.get_query_stats()['update_car_availability_in_db']['rows'] == 1
+
+
+def test_query_stats_leave_the_writer_alone_for_read_helpers(fresh_db):
+    writers = []
+
+    def read_in_new_thread():
+        database.get_all_cars_from_db()
+        writers.append(getattr(database._local, 'conn', None))     #Set only once the writer is opened
+
+    query_stats.reset_query_stats()
+    query_stats.enable_query_stats()
+    try:
+        thread = threading.Thread(target=read_in_new_thread)
+        thread.start()
+        thread.join()
+    finally:
+        query_stats.disable_query_stats()
+    assert writers == [None]
+    assert query_stats.get_query_stats()['get_all_cars_from_db']['rows'] == 10
+
+
+def test_upsert_keeps_availability_and_bumps_version(fresh_db):
+    database.update_car_availability_in_db('Car-001', False)
+    before = database.get_car_by_id_from_db('Car-001')
+    database.import_cars_from_csv(SEED_CSV, on_conflict='upsert')
+    after = database.get_car_by_id_from_db('Car-001')
+    assert (after[5], after[10]) == (0, before[10] + 1)
@@ -0,0 +1,167 @@
+import asyncio
+import multiprocessing
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+import database
+from conftest import insert_rental
+from system import CarRentalSystem
+
+
+def other_front_end(sql, params=()):                 #A write this process's caches know nothing about
+    conn = database.get_connection()
+    conn.execute(sql, params)
+    conn.commit()
+
+
+def rental_status(rental_id):
+    return database.get_connection().execute(
+        'SELECT status FROM rentals WHERE rental_id = ?', (rental_id,)).fetchone()[0]
+
+
+def test_return_is_all_or_nothing(system, monkeypatch):
+    rental, message = system.book_car('amy', 'Car-001', 2, 0)
+    assert rental, message
+    system.manage_rental_request(rental.get_rental_id(), 'approve')
+
+    def failing_release(car_ids, today):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(database, 'release_cars_in_db', failing_release)
+    with pytest.raises(sqlite3.OperationalError):
+        system.return_car(rental.get_rental_id())
+    assert rental_status(rental.get_rental_id()) == 'approved'     #The status change went with it
+    assert rental.get_status() == 'approved'
+
+
+def _book_in_new_process(db_path, car_id):           #A second front-end with its own system and connections
+    database._init_read_worker(db_path)              #Drops the parent's connections without closing them
+    CarRentalSystem._instance = None
+    rental, _ = CarRentalSystem().book_car('amy', car_id, 2, 0)
+    return rental is not None
+
+
+#Compare-and-set booking
+def test_reserve_refuses_a_stale_version(fresh_db):
+    version = database.get_car_by_id_from_db('Car-001')[10]
+    assert database.reserve_car_in_db('Car-001', version) == version + 1
+    assert database.reserve_car_in_db('Car-001', version) is None
+
+
+def test_only_one_of_many_processes_books_a_car(system, fresh_db):
+    with multiprocessing.get_context('fork').Pool(6) as pool:
+        booked = pool.starmap(_book_in_new_process, [(fresh_db, 'Car-001')] * 6)
+    assert sum(booked) == 1
+    rows = database.get_connection().execute(
+        "SELECT COUNT(*) FROM rentals WHERE car_id = 'Car-001' AND status = 'pending'").fetchone()
+    assert rows[0] == 1
+
+
+def test_update_car_keeps_availability_set_elsewhere(system):
+    system.get_all_cars()
+    other_front_end("UPDATE cars SET available_now = 0, version = version + 1 WHERE car_id = 'Car-001'")
+    assert system.update_car('Car-001', 60000, 75.0)[0]
+    assert database.get_car_by_id_from_db('Car-001')[5] == 0
+    assert not system.find_car_by_id('Car-001').is_available()
+
+
+def test_booking_a_car_another_front_end_took_fails(system):
+    system.get_all_cars()
+    other_front_end("UPDATE cars SET available_now = 0, version = version + 1 WHERE car_id = 'Car-001'")
+    rental, message = system.book_car('amy', 'Car-001', 2, 0)
+    assert rental is None and 'just booked' in message
+
+
+def test_booking_a_car_another_front_end_freed_succeeds(system):
+    system.get_all_cars()
+    other_front_end("UPDATE cars SET available_now = 1, version = version + 1 WHERE car_id = 'Car-003'")
+    assert 'Car-003' in [car.get_car_id() for car in system.search_available_cars()[0]]
+    rental, message = system.book_car('amy', 'Car-003', 2, 0)
+    assert rental, message
+    assert 'Car-003' not in [car.get_car_id() for car in system.search_available_cars()[0]]
+
+
+def test_analytics_counts_rentals_committed_out_of_number_order(system):
+    assert system.get_rental_analytics()['rentals_counted'] == 0
+    insert_rental('R-011', status='approved')
+    assert system.get_rental_analytics()['rentals_counted'] == 1
+    insert_rental('R-002', status='approved')        #Allocated earlier from a block, committed later
+    report = system.get_rental_analytics()
+    assert report['rentals_counted'] == 2
+    assert report == type(system._analytics)().report()
+
+
+def test_pending_queue_catches_up_on_many_external_requests(system):
+    assert system.pending_request_count() == 0
+    with database.transaction():
+        for number in range(600):
+            insert_rental(f'R-{1000 + number}')
+    assert system.pending_request_count() == 600
+    other_front_end("DELETE FROM rentals WHERE rental_id = 'R-1000'")
+    assert system.pending_request_count() == 599
+
+
+#Bookings that start later
+def test_car_booked_over_today_is_not_listed_as_available(system):
+    yesterday, later = date.today() - timedelta(days=1), date.today() + timedelta(days=2)
+    insert_rental('R-900', 'Car-001', 'approved', str(yesterday), str(later))
+    available = [car.get_car_id() for car in system.get_available_cars()]
+    searched = [car.get_car_id() for car in system.search_available_cars()[0]]
+    assert 'Car-001' not in available and 'Car-001' not in searched
+    assert 'Car-002' in available and 'Car-002' in searched
+
+
+def test_future_booking_keeps_the_car_available_until_it_starts(system):
+    rental, message = system.book_car('amy', 'Car-001', 2, 0, str(date.today() + timedelta(days=3)))
+    assert rental, message
+    assert 'Car-001' in [car.get_car_id() for car in system.get_available_cars()]
+
+
+#Read worker processes
+def test_listings_through_the_read_pool_match_in_process_reads(system):
+    expected = [car.get_car_id() for car in system.search_available_cars(page_size=4)[0]]
+    with database.ReadWorkerPool(2, multiprocessing.get_context('fork')) as pool:
+        system.use_read_pool(pool)
+        try:
+            assert [car.get_car_id() for car in system.search_available_cars(page_size=4)[0]] == expected
+            with database.transaction():             #Uncommitted writes are only visible in-process
+                database.update_car_availability_in_db(expected[0], False)
+                listed = [car.get_car_id() for car in system.search_available_cars(page_size=4)[0]]
+                assert expected[0] not in listed
+        finally:
+            system.use_read_pool(None)
+
+
+def test_closing_a_booking_that_never_took_the_car_keeps_it_taken(system):
+    today = date.today()
+    current, message = system.book_car('amy', 'Car-001', 2, 0)
+    assert current, message
+    system.manage_rental_request(current.get_rental_id(), 'approve')
+    insert_rental('R-900', 'Car-001', 'pending', str(today - timedelta(days=5)), str(today - timedelta(days=3)))
+    later, message = system.book_car('amy', 'Car-001', 2, 0, str(today + timedelta(days=5)))
+    assert later, message
+    system.manage_rental_request(later.get_rental_id(), 'approve')
+
+    assert system.manage_rental_request('R-900', 'reject')[0]
+    assert system.return_car(later.get_rental_id())[0]
+    assert database.get_car_by_id_from_db('Car-001')[5] == 0
+    assert not system.find_car_by_id('Car-001').is_available()
+
+    assert system.return_car(current.get_rental_id())[0]      #The booking that took the car gives it back
+    assert database.get_car_by_id_from_db('Car-001')[5] == 1
+    assert system.find_car_by_id('Car-001').is_available()
+
+
+#Several sessions at once
+def test_concurrent_registrations_of_one_name_never_raise(system):
+    from async_system import AsyncCarRentalSystem
+
+    async def register_all():
+        async with AsyncCarRentalSystem(system) as facade:
+            return await asyncio.gather(*[facade.register_customer('same', 'pw') for _ in range(8)])
+
+    results = asyncio.run(register_all())
+    assert sorted(success for success, _ in results) == [False] * 7 + [True]
+    assert {message for success, message in results if not success} == {"Username already exists."}
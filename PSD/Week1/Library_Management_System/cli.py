@@ -546,13 +546,18 @@ class LibraryCLI:
                 book = self.library.books[book_id]
                 
                 print(f"\nUpdating: {book.get_title()}")
+                changes = {}
                 new_title = input("New title (or press Enter to keep current): ").strip()
                 if new_title:
-                    book.title = new_title
+                    changes['title'] = new_title
                 
                 new_author = input("New author (or press Enter to keep current): ").strip()
                 if new_author:
-                    book.author = new_author
+                    changes['author'] = new_author
+                
+                if changes:
+                    # Through the library so the search index sees the new title and author
+                    self.library.update_book_information(book_id, **changes)
                 
                 new_copies = input("New number of copies (or press Enter to keep current): ").strip()
                 if new_copies:
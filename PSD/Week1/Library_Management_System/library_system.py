@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 from typing import List, Optional, Dict
 from models import Book, Member, BorrowRecord, Fine, Genre
+from search_index import BookSearchIndex
 
 class LibrarySystem:
     """Main library management system that coordinates all operations"""
@@ -11,10 +12,12 @@ class LibrarySystem:
         self.borrow_records: Dict[str, BorrowRecord] = {}
         self.fines: Dict[str, Fine] = {}
         self.fine_rate_per_day = fine_rate_per_day
+        self.search_index = BookSearchIndex()
     
     def add_book(self, book: Book) -> None:
         """Add a new book to the library"""
         self.books[book.get_book_id()] = book
+        self.search_index.add(book)
         print(f"Book added: {book}")
     
     def remove_book(self, book_id: str) -> bool:
@@ -23,6 +26,7 @@ class LibrarySystem:
             book = self.books[book_id]
             if book.get_available_copies() == book.get_total_copies():
                 del self.books[book_id]
+                self.search_index.remove(book_id)
                 print(f"Book removed: {book}")
                 return True
             else:
@@ -39,6 +43,7 @@ class LibrarySystem:
             for key, value in kwargs.items():
                 if hasattr(book, key):
                     setattr(book, key, value)
+            self.search_index.add(book)
             print(f"Book updated: {book}")
             return True
         else:
@@ -151,17 +156,8 @@ class LibrarySystem:
         return True
     
     def search_book(self, query: str) -> List[Book]:
-        """Search books by title, author, or ISBN"""
-        query = query.lower()
-        results = []
-        
-        for book in self.books.values():
-            if (query in book.get_title().lower() or 
-                query in book.get_author().lower() or 
-                query in book.get_isbn().lower()):
-                results.append(book)
-        
-        return results
+        """Search books by title, author, or ISBN, best matches first"""
+        return [self.books[book_id] for book_id in self.search_index.search(query)]
     
     def search_book_by_genre(self, genre: Genre) -> List[Book]:
         """Search books by genre"""
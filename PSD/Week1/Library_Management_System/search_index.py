@@ -0,0 +1,121 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
+
+from models import Book
+
+MIN_NGRAM_QUERY = 3
+TITLE_WEIGHT = 3
+AUTHOR_WEIGHT = 2
+ISBN_WEIGHT = 1
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split lowercased text into word tokens"""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def trigrams(text: str) -> Set[str]:
+    """All three-character substrings of the lowercased text"""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class BookSearchIndex:
+    """Inverted index with token and trigram postings over book titles, authors and ISBNs"""
+
+    def __init__(self):
+        self._fields: Dict[str, Tuple[str, str, str]] = {}   # book_id -> lowercased (title, author, isbn)
+        self._order: Dict[str, int] = {}
+        self._next_order = 0
+        self._tokens: Dict[str, Set[str]] = defaultdict(set)
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._fields)
+
+    def add(self, book: Book) -> None:
+        """Index a book, replacing any earlier entry for the same book ID"""
+        book_id = book.get_book_id()
+        if book_id in self._fields:
+            self._unindex(book_id)
+        else:
+            self._order[book_id] = self._next_order
+            self._next_order += 1
+        fields = (book.get_title().lower(), book.get_author().lower(), book.get_isbn().lower())
+        self._fields[book_id] = fields
+        for field in fields:
+            for token in tokenize(field):
+                self._tokens[token].add(book_id)
+            for gram in trigrams(field):
+                self._trigrams[gram].add(book_id)
+
+    def remove(self, book_id: str) -> None:
+        """Drop a book from the index"""
+        if book_id in self._fields:
+            self._unindex(book_id)
+            del self._fields[book_id]
+            del self._order[book_id]
+
+    def _unindex(self, book_id: str) -> None:
+        for field in self._fields[book_id]:
+            for token in tokenize(field):
+                self._discard(self._tokens, token, book_id)
+            for gram in trigrams(field):
+                self._discard(self._trigrams, gram, book_id)
+
+    @staticmethod
+    def _discard(postings: Dict[str, Set[str]], key: str, book_id: str) -> None:
+        ids = postings.get(key)
+        if ids is not None:
+            ids.discard(book_id)
+            if not ids:
+                del postings[key]
+
+    def search(self, query: str) -> List[str]:
+        """Book IDs whose title, author or ISBN contains the query, best match first"""
+        query = query.lower()
+        if len(query) < MIN_NGRAM_QUERY:
+            # Too short for trigrams, check every book
+            candidates = [book_id for book_id, fields in self._fields.items()
+                          if any(query in field for field in fields)]
+        else:
+            candidates = self._candidates(query)
+        query_tokens = tokenize(query)
+        scored = [(-self._score(book_id, query, query_tokens), self._order[book_id], book_id)
+                  for book_id in candidates]
+        scored.sort()
+        return [book_id for _, _, book_id in scored]
+
+    def _candidates(self, query: str) -> List[str]:
+        postings = []
+        for gram in trigrams(query):
+            ids = self._trigrams.get(gram)
+            if not ids:
+                return []
+            postings.append(ids)
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for ids in postings[1:]:
+            candidates &= ids
+            if not candidates:
+                return []
+        # Sharing every trigram does not make the query a substring, so confirm it
+        return [book_id for book_id in candidates
+                if any(query in field for field in self._fields[book_id])]
+
+    def _score(self, book_id: str, query: str, query_tokens: List[str]) -> int:
+        score = 0
+        for field, weight in zip(self._fields[book_id], (TITLE_WEIGHT, AUTHOR_WEIGHT, ISBN_WEIGHT)):
+            if field == query:
+                score += 4 * weight
+            elif field.startswith(query):
+                score += 2 * weight
+            elif query in field:
+                score += weight
+        # Every query word appearing as a whole word ranks above a match inside a longer word
+        if query_tokens and all(book_id in self._tokens.get(token, ()) for token in query_tokens):
+            score += TITLE_WEIGHT
+        return score
@@ -80,6 +80,21 @@ def test_basic_functionality():
         else:
             print("❌ Book search failed")
         
+        # Test search index upkeep and ranking
+        other = Book("A Test of Time", "Someone Else", "987-654-321", datetime.now(), Genre.HISTORY)
+        library.add_book(other)
+        library.update_book_information(other.get_book_id(), title="Late Arrivals")
+        ranked = library.search_book("test")
+        if (ranked and ranked[0] is book and other not in ranked
+                and library.search_book("arrival") == [other]
+                and library.search_book("54") == [other]):
+            print("✅ Book search index working")
+        else:
+            print("❌ Book search index failed")
+        library.remove_book(other.get_book_id())
+        if library.search_book("arrival"):
+            print("❌ Removed book still found by search")
+        
         # Generate report
         report = library.generate_report()
         if report: